@@ -0,0 +1,158 @@
+"""
+analytics.py
+------------
+In-process columnar copy of the mentions table, held as NumPy arrays, that answers
+report-style group-bys (any subreddit filter, time window or weighting) without SQL.
+"""
+
+from datetime import datetime
+import threading
+
+import numpy as np
+from sqlalchemy import literal_column, select
+
+from ..models import Mention
+from ..services.data_generation import MENTIONS_REBUILD_NAME, get_data_generation
+
+# NaT (missing created_utc) after conversion to int64 seconds.
+_MISSING_TIME = np.iinfo(np.int64).min
+
+class _Dictionary:
+    """Maps strings to dense integer codes for an array column."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+class MentionAnalytics:
+    """
+    Columnar store of mentions: ticker, subreddit and region codes, sentiment (NaN when
+    unscored), upvotes and created_utc as epoch seconds.
+    Whenever the data generation changes, sync() appends rows added since the last load
+    (tracked by rowid) and reloads the upvotes of rows updated since the last generation.
+    A rebuilt mentions table (see rollups.rebuild_mentions) triggers a full reload.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.tickers = _Dictionary()
+        self.subreddits = _Dictionary()
+        self.regions = _Dictionary()
+        self.ticker_idx = np.empty(0, dtype=np.int32)
+        self.subreddit_idx = np.empty(0, dtype=np.int32)
+        self.region_idx = np.empty(0, dtype=np.int32)
+        self.sentiment = np.empty(0, dtype=np.float64)
+        self.upvotes = np.empty(0, dtype=np.int64)
+        self.created = np.empty(0, dtype=np.int64)
+        self.rowids = np.empty(0, dtype=np.int64) # Ascending, aligned with the other columns
+        self.last_rowid = 0
+        self.generation = None
+        self.rebuild = None
+
+    def __len__(self):
+        return len(self.ticker_idx)
+
+    # --- Loading ---
+    def sync(self, session, generation: int):
+        """Loads new mention rows and changed upvotes if the data generation changed since the last sync."""
+        with self._lock:
+            if generation == self.generation:
+                return
+            rebuild = get_data_generation(session, MENTIONS_REBUILD_NAME)
+            if rebuild != self.rebuild:
+                self._reset() # The table was rebuilt, so rowids started over
+                self.rebuild = rebuild
+            rowid = literal_column("mentions.rowid")
+            if self.generation is not None and len(self):
+                self._update_upvotes(session.execute(
+                    select(rowid, Mention.upvotes)
+                    .where(Mention.updated_generation > self.generation, rowid <= self.last_rowid)
+                ).all())
+            rows = session.execute(
+                select(rowid, Mention.ticker, Mention.region, Mention.subreddit, Mention.created_utc,
+                       Mention.sentiment, Mention.upvotes)
+                .where(rowid > self.last_rowid)
+                .order_by(rowid)
+            ).all()
+            if rows:
+                self._append(rows)
+            self.generation = generation
+
+    def _update_upvotes(self, rows):
+        if not rows:
+            return
+        rowids = np.array([r[0] for r in rows], dtype=np.int64)
+        positions = np.searchsorted(self.rowids, rowids)
+        found = (positions < len(self.rowids)) & (self.rowids[np.minimum(positions, len(self.rowids) - 1)] == rowids)
+        upvotes = np.array([r[1] or 0 for r in rows], dtype=np.int64)
+        self.upvotes[positions[found]] = upvotes[found]
+
+    def _append(self, rows):
+        self.ticker_idx = np.concatenate([self.ticker_idx, np.fromiter((self.tickers.encode(r[1]) for r in rows), np.int32, len(rows))])
+        self.region_idx = np.concatenate([self.region_idx, np.fromiter((self.regions.encode(r[2]) for r in rows), np.int32, len(rows))])
+        self.subreddit_idx = np.concatenate([self.subreddit_idx, np.fromiter((self.subreddits.encode(r[3] or "") for r in rows), np.int32, len(rows))])
+        created = np.array([r[4] for r in rows], dtype="datetime64[s]").astype(np.int64)
+        self.created = np.concatenate([self.created, created])
+        self.sentiment = np.concatenate([self.sentiment, np.array([np.nan if r[5] is None else r[5] for r in rows], dtype=np.float64)])
+        self.upvotes = np.concatenate([self.upvotes, np.array([r[6] or 0 for r in rows], dtype=np.int64)])
+        self.rowids = np.concatenate([self.rowids, np.array([r[0] for r in rows], dtype=np.int64)])
+        self.last_rowid = rows[-1][0]
+
+    # --- Queries ---
+    def report(self, subreddits=None, since: datetime | None = None, until: datetime | None = None) -> list[dict]:
+        """
+        Groups mentions by (ticker, region) after optional subreddit and time filters.
+        Returns dicts with ticker, region, mentions, avg_sentiment and weighted_sentiment,
+        where the weight of a mention is max(upvotes, 0) + 1.
+        """
+        with self._lock:
+            mask = np.ones(len(self), dtype=bool)
+            if subreddits:
+                codes = [self.subreddits.codes[name] for name in subreddits if name in self.subreddits.codes]
+                mask &= np.isin(self.subreddit_idx, np.array(codes, dtype=np.int32))
+            if since is not None or until is not None:
+                mask &= self.created != _MISSING_TIME
+                if since is not None:
+                    mask &= self.created >= np.datetime64(since, "s").astype(np.int64)
+                if until is not None:
+                    mask &= self.created < np.datetime64(until, "s").astype(np.int64)
+
+            n_regions = max(len(self.regions.values), 1)
+            group = self.ticker_idx[mask].astype(np.int64) * n_regions + self.region_idx[mask]
+            sentiment = self.sentiment[mask]
+            scored = ~np.isnan(sentiment)
+            sentiment = np.where(scored, sentiment, 0.0)
+            weights = (np.maximum(self.upvotes[mask], 0) + 1) * scored
+
+            size = len(self.tickers.values) * n_regions
+            counts = np.bincount(group, minlength=size)
+            scored_counts = np.bincount(group, weights=scored, minlength=size)
+            sentiment_sums = np.bincount(group, weights=sentiment, minlength=size)
+            weight_sums = np.bincount(group, weights=weights, minlength=size)
+            weighted_sums = np.bincount(group, weights=sentiment * weights, minlength=size)
+
+            results = []
+            for key in np.nonzero(counts)[0]:
+                ticker_code, region_code = divmod(int(key), n_regions)
+                results.append({
+                    "ticker": self.tickers.values[ticker_code],
+                    "region": self.regions.values[region_code],
+                    "mentions": int(counts[key]),
+                    "avg_sentiment": float(sentiment_sums[key] / scored_counts[key]) if scored_counts[key] else None,
+                    "weighted_sentiment": float(weighted_sums[key] / weight_sums[key]) if weight_sums[key] else None,
+                })
+            return results
+
+# Shared by all API requests in this process.
+mention_analytics = MentionAnalytics()
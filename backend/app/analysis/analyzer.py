@@ -0,0 +1,76 @@
+"""
+analyzer.py
+-----------
+CPU-bound analysis stage of ingestion: ticker extraction and sentiment scoring for new
+posts and comments. Works on plain records only (no database access), so chunks can be
+analyzed in worker processes while a single writer stores the results.
+"""
+
+import time
+
+from .sentiment import analyze_sentiment
+from .tickers import extract_tickers
+
+def analyze_records(records: list[dict]) -> tuple[list[dict], dict]:
+    """
+    Analyzes one chunk of post records. Each record holds:
+    - post_text: title and selftext of a new post, or None if the post is already stored
+    - post_ticker: (ticker, region) of a stored post, if it has one
+    - post_score: cached sentiment of post_text, or None
+    - comments: list of (body, cached score or None) for new comments
+    Texts are only scored when they are counted for a ticker and have no cached score.
+    Returns one result per record, in order, plus the timings of the chunk:
+    {"extract": seconds, "extracted": texts, "score": seconds, "scored": texts}.
+    Timings are returned rather than recorded, since this may run in a worker process.
+    """
+    timings = {"extract": 0.0, "extracted": 0, "score": 0.0, "scored": 0}
+    clock = time.perf_counter
+
+    def extract(text):
+        started = clock()
+        tickers = extract_tickers(text)
+        timings["extract"] += clock() - started
+        timings["extracted"] += 1
+        return tickers
+
+    def score(text):
+        started = clock()
+        value = analyze_sentiment(text)
+        timings["score"] += clock() - started
+        timings["scored"] += 1
+        return value
+
+    results = []
+    for record in records:
+        post_tickers = []
+        post_score = None
+        post_computed = False
+        if record["post_text"] is not None:
+            post_tickers = extract(record["post_text"])
+            if post_tickers:
+                post_score = record["post_score"]
+                if post_score is None:
+                    post_score = score(record["post_text"])
+                    post_computed = True
+
+        # Comments without a ticker inherit the post's primary one.
+        inherited = post_tickers[0] if post_tickers else record["post_ticker"]
+        comments = []
+        for body, cached in record["comments"]:
+            tickers = extract(body)
+            comment_score = None
+            computed = False
+            if tickers or inherited:
+                comment_score = cached
+                if comment_score is None:
+                    comment_score = score(body)
+                    computed = True
+            comments.append((tickers, comment_score, computed))
+
+        results.append({
+            "post_tickers": post_tickers,
+            "post_score": post_score,
+            "post_computed": post_computed,
+            "comments": comments,
+        })
+    return results, timings
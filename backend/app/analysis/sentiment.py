@@ -2,24 +2,56 @@
 sentiment.py
 ------------
 Performs sentiment analysis on text data.
+NLTK and the VADER lexicon are loaded the first time a text is scored.
 """
 
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from concurrent.futures import ProcessPoolExecutor
 
-# Download the VADER lexicon if it's not already present
-try:
-    nltk.data.find('sentiment/vader_lexicon.zip')
-except LookupError:
-    print("Downloading VADER lexicon...")
-    nltk.download('vader_lexicon')
+# Batches smaller than this are scored in-process; spawning workers would cost more than it saves.
+MIN_PARALLEL_BATCH = 1000
 
+_analyzer = None
+
+def get_analyzer():
+    """Initializes and returns a singleton VADER analyzer (the lexicon is parsed only once)."""
+    global _analyzer
+    if _analyzer is None:
+        import nltk
+        from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+        # Download the VADER lexicon if it's not already present
+        try:
+            nltk.data.find('sentiment/vader_lexicon.zip')
+        except LookupError:
+            print("Downloading VADER lexicon...")
+            nltk.download('vader_lexicon')
+        _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
 
 def analyze_sentiment(text: str) -> float:
     """
     Analyzes text and returns a compound sentiment score.
     Score ranges from -1 (most negative) to +1 (most positive).
     """
-    analyzer = SentimentIntensityAnalyzer()
     # The 'compound' score is a useful single metric for sentiment
-    return analyzer.polarity_scores(text)['compound']
\ No newline at end of file
+    return get_analyzer().polarity_scores(text)['compound']
+
+def _analyze_chunk(texts: list[str]) -> list[float]:
+    """Scores a chunk of texts. Runs inside worker processes, each with its own analyzer."""
+    return [analyze_sentiment(text) for text in texts]
+
+def analyze_sentiment_batch(texts: list[str], workers: int | None = None, chunksize: int = 500) -> list[float]:
+    """
+    Scores a list of texts and returns their compound scores in the same order.
+    If workers > 1 and the batch is large enough, scoring is spread over a process pool.
+    """
+    texts = list(texts)
+    if not workers or workers <= 1 or len(texts) < MIN_PARALLEL_BATCH:
+        return _analyze_chunk(texts)
+
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    scores = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_scores in executor.map(_analyze_chunk, chunks):
+            scores.extend(chunk_scores)
+    return scores
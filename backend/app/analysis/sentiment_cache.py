@@ -0,0 +1,189 @@
+"""
+sentiment_cache.py
+------------------
+Content-addressed cache for sentiment scores, so repeated texts are only scored once.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import unicodedata
+
+from sqlalchemy import delete, func, insert, select
+
+from ..models import CachedSentiment
+from .sentiment import analyze_sentiment, analyze_sentiment_batch
+
+# Bump this whenever the scoring logic changes, so old cached scores are no longer used.
+SCORER_VERSION = "vader-1"
+
+# Persistent lookups are batched into IN queries of at most this many keys.
+_LOOKUP_BATCH_SIZE = 500
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text before hashing: unicode NFC and collapsed whitespace.
+    Case is kept because VADER treats ALL-CAPS words as emphasis.
+    """
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def text_hash(text: str) -> str:
+    """Returns the cache key for a piece of text."""
+    payload = f"{SCORER_VERSION}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+class SentimentCache:
+    """
+    Two-tier sentiment cache.
+    - An in-process LRU dict bounded by max_entries.
+    - An optional SQLite table (sentiment_cache) when an engine is given, so hits survive restarts.
+    New scores are buffered and written to the table by flush().
+    """
+
+    def __init__(self, max_entries: int = 50_000, engine=None):
+        self.max_entries = max_entries
+        self.engine = engine
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._table_ready = False
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- In-memory tier ---
+    def _remember(self, key: str, score: float):
+        self._entries[key] = score
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # Evict the least recently used entry
+            self.evictions += 1
+
+    def _recall(self, key: str):
+        score = self._entries.get(key)
+        if score is not None:
+            self._entries.move_to_end(key)
+        return score
+
+    # --- Persistent tier ---
+    def _ensure_table(self):
+        if not self._table_ready:
+            CachedSentiment.__table__.create(bind=self.engine, checkfirst=True)
+            self._table_ready = True
+
+    def _load_persistent(self, keys: list[str]) -> dict:
+        """Looks up keys in the SQLite tier with as few IN queries as possible."""
+        if self.engine is None or not keys:
+            return {}
+        self._ensure_table()
+        found = {}
+        with self.engine.connect() as conn:
+            for i in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                batch = keys[i:i + _LOOKUP_BATCH_SIZE]
+                rows = conn.execute(
+                    select(CachedSentiment.text_hash, CachedSentiment.sentiment_score)
+                    .where(CachedSentiment.text_hash.in_(batch))
+                )
+                found.update({row.text_hash: row.sentiment_score for row in rows})
+        return found
+
+    def flush(self):
+        """Writes newly computed scores to the SQLite tier."""
+        if self.engine is None or not self._pending:
+            self._pending.clear()
+            return
+        self._ensure_table()
+        now = datetime.utcnow()
+        rows = [{"text_hash": key, "sentiment_score": score, "created_at": now} for key, score in self._pending.items()]
+        with self.engine.begin() as conn:
+            conn.execute(insert(CachedSentiment).prefix_with("OR IGNORE"), rows)
+        self._pending.clear()
+
+    def prune(self, max_age_days: int | None = None, max_rows: int | None = None) -> int:
+        """
+        Evicts entries from the SQLite tier: anything older than max_age_days,
+        then the oldest rows beyond max_rows. Returns the number of deleted rows.
+        """
+        if self.engine is None:
+            return 0
+        self._ensure_table()
+        deleted = 0
+        with self.engine.begin() as conn:
+            if max_age_days is not None:
+                cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+                deleted += conn.execute(delete(CachedSentiment).where(CachedSentiment.created_at < cutoff)).rowcount
+            if max_rows is not None:
+                total = conn.execute(select(func.count()).select_from(CachedSentiment)).scalar()
+                if total > max_rows:
+                    oldest = select(CachedSentiment.text_hash).order_by(CachedSentiment.created_at).limit(total - max_rows)
+                    deleted += conn.execute(delete(CachedSentiment).where(CachedSentiment.text_hash.in_(oldest))).rowcount
+        return deleted
+
+    # --- Public scoring API ---
+    def score(self, text: str) -> float:
+        """Returns the sentiment score for text, computing it only on a cache miss."""
+        return self.score_many([text])[0]
+
+    def lookup_many(self, keys: list[str]) -> tuple[dict, dict]:
+        """
+        Looks up cache keys in both tiers without scoring anything or counting hits.
+        Returns ({key: score} found in memory, {key: score} found only in the SQLite tier).
+        """
+        memory, persistent = {}, {}
+        missing = []
+        for key in keys:
+            if key in memory or key in persistent:
+                continue
+            score = self._recall(key)
+            if score is not None:
+                memory[key] = score
+            else:
+                missing.append(key)
+        if missing:
+            persistent = self._load_persistent(list(dict.fromkeys(missing)))
+            for key, score in persistent.items():
+                self._remember(key, score)
+        return memory, persistent
+
+    def record(self, hits: int, persistent_hits: int, computed: dict):
+        """Counts lookups resolved outside score_many and stores scores computed for the misses."""
+        self.hits += hits
+        self.persistent_hits += persistent_hits
+        self.misses += len(computed)
+        for key, score in computed.items():
+            self._remember(key, score)
+            self._pending[key] = score
+
+    def score_many(self, texts: list[str], workers: int | None = None) -> list[float]:
+        """Scores a list of texts, looking up all cache tiers in bulk before scoring the misses."""
+        keys = [text_hash(text) for text in texts]
+        memory, persistent = self.lookup_many(keys)
+        scores = {**persistent, **memory}
+
+        to_score = {}
+        for key, text in zip(keys, texts):
+            if key not in scores and key not in to_score:
+                to_score[key] = text
+        computed = {}
+        if to_score:
+            if len(to_score) == 1:
+                computed_scores = [analyze_sentiment(next(iter(to_score.values())))]
+            else:
+                computed_scores = analyze_sentiment_batch(list(to_score.values()), workers=workers)
+            computed = dict(zip(to_score, computed_scores))
+            scores.update(computed)
+        self.record(len(memory), len(persistent), computed)
+
+        return [scores[key] for key in keys]
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters for reporting."""
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+        }
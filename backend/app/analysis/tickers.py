@@ -69,18 +69,68 @@ TICKER_MAP = { # region can be 'US' or 'NO'
     "KOG": {"aliases": ["Kongsberg"], "region": "NO"},
 }
 
+def _compile_ticker_matcher(ticker_map: dict):
+    """
+    Builds a single-pass matcher from a ticker map.
+    Returns (pattern, alias_lookup, ticker_order, shadowed) where alias_lookup maps a
+    lowercased alias to the tickers that use it.
+    """
+    alias_lookup = {}
+    ticker_order = {}
+    for index, (official_ticker, data) in enumerate(ticker_map.items()):
+        ticker_order[official_ticker] = (index, data["region"])
+        for alias in data["aliases"]:
+            tickers = alias_lookup.setdefault(alias.lower(), [])
+            if official_ticker not in tickers:
+                tickers.append(official_ticker)
+
+    # Longest aliases first, so "AMC Entertainment" wins over "AMC" at the same position.
+    aliases = sorted(alias_lookup, key=len, reverse=True)
+
+    # A shorter alias of one ticker can be hidden by a longer alias of another ticker
+    # that starts with it and has a word boundary right after it (e.g. "Bank" vs "Bank of X").
+    # These rare cases keep their own pattern.
+    def _boundary_after(alias, other):
+        is_word_char = lambda char: re.match(r'\w', char) is not None
+        return is_word_char(alias[-1]) != is_word_char(other[len(alias)])
+
+    shadowed = []
+    for alias in aliases:
+        owners = set(alias_lookup[alias])
+        if any(
+            len(other) > len(alias) and other.startswith(alias) and _boundary_after(alias, other)
+            and set(alias_lookup[other]) != owners
+            for other in aliases
+        ):
+            shadowed.append((re.compile(r'\b' + re.escape(alias) + r'\b', re.IGNORECASE), alias_lookup[alias]))
+
+    # The lookahead makes every match zero-width, so overlapping aliases are all seen.
+    alternation = "|".join(re.escape(alias) for alias in aliases)
+    pattern = re.compile(r'(?=\b(' + alternation + r')\b)', re.IGNORECASE)
+    return pattern, alias_lookup, ticker_order, shadowed
+
+_matcher = _compile_ticker_matcher(TICKER_MAP)
+
+def refresh_ticker_matcher():
+    """Rebuilds the compiled matcher. Call this after modifying TICKER_MAP at runtime."""
+    global _matcher
+    _matcher = _compile_ticker_matcher(TICKER_MAP)
+
 def extract_tickers(text: str) -> list[tuple[str, str]]:
-    """Extracts a list of (ticker, region) tuples found in a piece of text."""
-    found_tickers = []
+    """
+    Extracts a list of (ticker, region) tuples found in a piece of text.
+    Tickers are returned in TICKER_MAP order, each at most once.
+    """
+    pattern, alias_lookup, ticker_order, shadowed = _matcher
     # Use a set to avoid adding the same ticker multiple times
     found_symbols = set()
-    for official_ticker, data in TICKER_MAP.items():
-        for alias in data["aliases"]:
-            if re.search(r'\b' + re.escape(alias) + r'\b', text, re.IGNORECASE):
-                if official_ticker not in found_symbols:
-                    found_tickers.append((official_ticker, data["region"]))
-                    found_symbols.add(official_ticker)
-    return found_tickers
+    for match in pattern.finditer(text):
+        found_symbols.update(alias_lookup[match.group(1).lower()])
+    for alias_pattern, tickers in shadowed:
+        if not found_symbols.issuperset(tickers) and alias_pattern.search(text):
+            found_symbols.update(tickers)
+    ordered = sorted(found_symbols, key=lambda symbol: ticker_order[symbol][0])
+    return [(symbol, ticker_order[symbol][1]) for symbol in ordered]
 
 def get_ticker_search_query() -> str:
     """
@@ -4,18 +4,43 @@ api.py
 FastAPI application for serving market sentiment data.
 """
 
-from fastapi import FastAPI, Depends, Query, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Query, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, literal, select, tuple_
+from typing import List, Optional
+import base64
+import json
+import time
+from datetime import datetime, timedelta, timezone
 
-from .database import SessionLocal
-from .models import RedditComment, RedditPost, TickerData
-from .schemas import ReportRow, TickerDetails
-from .services import finnhub_client
+from . import metrics
+from .database import ReaderSessionLocal, missing_schema
+from .analysis.analytics import mention_analytics
+from .models import Mention, PipelineRun, RedditComment, RedditPost, SentimentRollup, TickerData
+from .report_stream import ReportBroadcaster
+from .response_cache import CachedBody, ResponseCache, make_etag, negotiate_encoding
+from .schemas import MentionPage, ReportRow, TickerDetails, TickerTimeseries
+from .services.data_generation import get_data_generation
+from .services.rollups import hour_bucket
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The API only reads; migrations run with the ingest jobs or 'python -m app.main migrate',
+    # so startup never takes the write lock. An outdated database is refused up front
+    # instead of failing on the first request.
+    missing = missing_schema()
+    if missing:
+        raise RuntimeError(
+            f"The database schema is out of date (missing: {', '.join(missing)}). "
+            "Run migrations first: python -m app.main migrate"
+        )
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS Middleware ---
 # This allows your React frontend (running on a different port) to communicate with this backend.
@@ -29,60 +54,157 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# --- Request metrics ---
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Records each request's latency (until the response starts) per route template."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        # Templates like /api/ticker/{ticker_symbol} keep the label set small.
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - started,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=status,
+        )
+
 # --- Dependency for getting a DB session ---
 def get_db():
-    db = SessionLocal()
+    db = ReaderSessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+# --- Response caching ---
+# Responses are cached per normalized query and revalidated against the data generation,
+# which insert_posts and update_all_ticker_data bump on every commit.
+response_cache = ResponseCache()
+
+def _cached_response(request: Request, db: Session, key: tuple, build):
+    """
+    Returns a 304 if the client's ETag is current, else the cached body (building it
+    with build() on a miss) with an ETag header, compressed as the client accepts.
+    build() must return plain dicts and lists; they are serialized once per generation.
+    """
+    generation = get_data_generation(db)
+    etag = make_etag(generation, key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key, generation)
+    if body is None:
+        body = CachedBody(build())
+        response_cache.put(key, generation, body)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), body.size)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body.get(encoding), media_type="application/json", headers=headers)
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Converts an aware datetime (e.g. '...Z' in a query) to naive UTC, as stored in the database."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 @app.get("/api/subreddits", response_model=List[str])
-def get_subreddits(db: Session = Depends(get_db)):
+def get_subreddits(request: Request, db: Session = Depends(get_db)):
     """Returns a list of unique subreddits from the database."""
-    results = db.query(RedditPost.subreddit).distinct().order_by(RedditPost.subreddit).all()
-    return [row[0] for row in results]
+    def build():
+        results = db.query(RedditPost.subreddit).distinct().order_by(RedditPost.subreddit).all()
+        return [row[0] for row in results]
+    return _cached_response(request, db, ("subreddits",), build)
 
 @app.get("/api/report", response_model=List[ReportRow])
 def get_sentiment_report(
+    request: Request,
     db: Session = Depends(get_db),
     subreddit: List[str] = Query(None, description="Filter by a list of subreddits"),
-    sort_by: str = Query("mentions", description="Sort by 'mentions' or 'sentiment'"),
+    sort_by: str = Query("mentions", description="Sort by 'mentions', 'sentiment' or 'weighted_sentiment'"),
     order: str = Query("desc", description="Sort order 'asc' or 'desc'"),
+    since: Optional[datetime] = Query(None, description="Only count mentions created at or after this time (UTC)"),
+    until: Optional[datetime] = Query(None, description="Only count mentions created before this time (UTC)"),
+    limit: Optional[int] = Query(None, ge=1, description="Only return the first N rows after sorting"),
 ):
-    """Generates and returns the aggregated sentiment report for all tickers."""
-    # Query for sentiment aggregation
-    query = db.query(
-        RedditComment.ticker_symbol.label("ticker"),
-        RedditComment.region.label("region"),
-        func.count(RedditComment.id).label("mentions"),
-        func.avg(RedditComment.sentiment_score).label("avg_sentiment"),
-        TickerData.name,
-        TickerData.current_price,
-        TickerData.price_change,
-        TickerData.price_percent_change,
-        TickerData.day_high,
-        TickerData.day_low,
-    ).join(
-        TickerData, RedditComment.ticker_symbol == TickerData.ticker, isouter=True
-    ).filter(RedditComment.ticker_symbol != None)
-
-    if subreddit and len(subreddit) > 0:
-        # Use a subquery for more robust filtering. This finds all post_ids that match the subreddit filter.
-        subquery = db.query(RedditPost.id).filter(RedditPost.subreddit.in_(subreddit))
-        # Then filter the comments to only include those whose post_id is in the subquery result.
-        query = query.filter(RedditComment.post_id.in_(subquery))
-
-    query = query.group_by(RedditComment.ticker_symbol, RedditComment.region)
-
-    sort_column = func.count(RedditComment.id) if sort_by == "mentions" else func.avg(RedditComment.sentiment_score)
-    sort_logic = sort_column.desc() if order == "desc" else sort_column.asc()
-    query = query.order_by(sort_logic)
-
-    results = query.all()
-    return results
+    """Returns the aggregated sentiment report, served from the response cache when possible."""
+    # Normalize the query so equivalent requests share a cache entry.
+    subreddits = tuple(sorted(set(subreddit or [])))
+    if sort_by not in ("mentions", "weighted_sentiment"):
+        sort_by = "sentiment"
+    order = "desc" if order == "desc" else "asc"
+    since, until = _naive_utc(since), _naive_utc(until)
+    window = tuple(value.isoformat() if value else None for value in (since, until))
+    key = ("report", subreddits, sort_by, order, window, limit)
+
+    def build():
+        mention_analytics.sync(db, get_data_generation(db))
+        return build_sentiment_report(db, list(subreddits), sort_by, order, since, until, limit)
+    return _cached_response(request, db, key, build)
+
+# --- Live report stream ---
+def _build_stream_rows(db: Session, subreddits: List[str]):
+    mention_analytics.sync(db, get_data_generation(db))
+    return build_sentiment_report(db, subreddits, "mentions", "desc")
+
+report_broadcaster = ReportBroadcaster(_build_stream_rows)
+
+@app.get("/api/stream/report")
+async def stream_sentiment_report(
+    request: Request,
+    subreddit: List[str] = Query(None, description="Filter by a list of subreddits"),
+):
+    """
+    Server-Sent Events stream of the report. The first event ('snapshot') holds every row;
+    after each ingest or financial data commit a 'delta' event holds only the rows whose
+    mentions, sentiment or price fields changed, plus any rows that disappeared.
+    """
+    subreddits = tuple(sorted(set(subreddit or [])))
+    return StreamingResponse(
+        report_broadcaster.events(request, subreddits),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# TickerData columns copied onto each report row.
+_TICKER_FIELDS = ("name", "current_price", "price_change", "price_percent_change", "day_high", "day_low")
+_NO_TICKER_DATA = (None,) * len(_TICKER_FIELDS)
+
+def build_sentiment_report(db: Session, subreddit: List[str], sort_by: str, order: str,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None,
+                           limit: Optional[int] = None):
+    """
+    Generates the aggregated sentiment report for all tickers, as plain dicts shaped like ReportRow.
+    The group-by runs on the in-memory columnar copy of the mentions table (see
+    analysis/analytics.py), so any subreddit and time slice is answered without SQL;
+    only the price data for the returned tickers is read from the database.
+    """
+    rows = mention_analytics.report(subreddit, since, until)
+
+    sort_field = "mentions" if sort_by == "mentions" else ("weighted_sentiment" if sort_by == "weighted_sentiment" else "avg_sentiment")
+    # Missing values sort lowest, as they do in SQLite.
+    rows.sort(key=lambda row: (row[sort_field] is not None, row[sort_field] or 0), reverse=order == "desc")
+    if limit is not None:
+        rows = rows[:limit]
+
+    tickers = {row["ticker"] for row in rows}
+    ticker_data = {}
+    if tickers:
+        columns = [getattr(TickerData, field) for field in _TICKER_FIELDS]
+        ticker_data = {
+            data[0]: tuple(data[1:])
+            for data in db.execute(select(TickerData.ticker, *columns).where(TickerData.ticker.in_(tickers)))
+        }
+    for row in rows:
+        row.update(zip(_TICKER_FIELDS, ticker_data.get(row["ticker"], _NO_TICKER_DATA)))
+    return rows
 
 @app.get("/api/ticker/{ticker_symbol}", response_model=TickerDetails)
 def get_ticker_details(ticker_symbol: str, db: Session = Depends(get_db)):
@@ -105,4 +227,180 @@ def get_ticker_details(ticker_symbol: str, db: Session = Depends(get_db)):
         },
         "pe_ratio": ticker_data.pe_ratio,
         "market_cap": ticker_data.market_cap,
-    }
\ No newline at end of file
+    }
+
+# --- Time series ---
+# Rollup buckets are hourly; daily points are summed from them in SQL.
+TIMESERIES_INTERVALS = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+TIMESERIES_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+TIMESERIES_DEFAULT_RANGE = timedelta(days=7)
+
+def _bucket_floor(value: datetime, interval: str) -> datetime:
+    value = hour_bucket(value)
+    return value.replace(hour=0) if interval == "day" else value
+
+@app.get("/api/ticker/{ticker_symbol}/timeseries", response_model=TickerTimeseries)
+def get_ticker_timeseries(
+    ticker_symbol: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    start: Optional[datetime] = Query(None, description="Start of the range (UTC), defaults to 7 days before end"),
+    end: Optional[datetime] = Query(None, description="End of the range (UTC, exclusive), defaults to now"),
+    interval: str = Query("hour", description="Bucket size, 'hour' or 'day'"),
+    subreddit: List[str] = Query(None, description="Filter by a list of subreddits"),
+):
+    """Returns mention counts and mean sentiment per hour or day for one ticker, read from sentiment_rollup."""
+    if interval not in TIMESERIES_INTERVALS:
+        raise HTTPException(status_code=400, detail="interval must be 'hour' or 'day'.")
+    end = _naive_utc(end) or datetime.utcnow()
+    start = _naive_utc(start) or end - TIMESERIES_DEFAULT_RANGE
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end.")
+    # Widen the range to whole buckets so cached responses are shared between nearby requests.
+    start = _bucket_floor(start, interval)
+    if _bucket_floor(end, interval) != end:
+        end = _bucket_floor(end, interval) + TIMESERIES_STEPS[interval]
+
+    ticker = ticker_symbol.upper()
+    subreddits = tuple(sorted(set(subreddit or [])))
+    key = ("timeseries", ticker, interval, start.isoformat(), end.isoformat(), subreddits)
+
+    def build():
+        return build_ticker_timeseries(db, ticker, start, end, interval, list(subreddits))
+    return _cached_response(request, db, key, build)
+
+def build_ticker_timeseries(db: Session, ticker: str, start: datetime, end: datetime, interval: str,
+                            subreddit: List[str]):
+    """
+    Sums the hourly rollup buckets of one ticker into hour or day buckets.
+    The rollup's primary key starts with the ticker, so only that ticker's rows are read.
+    """
+    bucket = func.strftime(TIMESERIES_INTERVALS[interval], SentimentRollup.bucket_start)
+    query = db.query(
+        bucket.label("bucket"),
+        func.sum(SentimentRollup.mention_count).label("mentions"),
+        (func.sum(SentimentRollup.sentiment_sum) / func.nullif(func.sum(SentimentRollup.sentiment_count), 0)).label("avg_sentiment"),
+    ).filter(
+        SentimentRollup.ticker == ticker,
+        SentimentRollup.bucket_start >= start,
+        SentimentRollup.bucket_start < end,
+    )
+    if subreddit:
+        query = query.filter(SentimentRollup.subreddit.in_(subreddit))
+    rows = query.group_by(bucket).order_by(bucket).all()
+
+    return TickerTimeseries(
+        ticker=ticker,
+        interval=interval,
+        start=start,
+        end=end,
+        points=[
+            {"bucket_start": datetime.fromisoformat(row.bucket), "mentions": row.mentions, "avg_sentiment": row.avg_sentiment}
+            for row in rows
+        ],
+    ).dict()
+
+# --- Mention drill-down ---
+# Pages are keyed on (created_utc, source_id, source_type), newest first, and served from
+# ix_mentions_ticker_keyset, so a deep page costs the same as the first one.
+def _encode_cursor(created_utc: datetime, source_id: str, source_type: str) -> str:
+    payload = json.dumps([created_utc.isoformat(), source_id, source_type])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        created_utc, source_id, source_type = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_utc), source_id, source_type
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@app.get("/api/ticker/{ticker_symbol}/mentions", response_model=MentionPage)
+def get_ticker_mentions(
+    ticker_symbol: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    subreddit: List[str] = Query(None, description="Filter by a list of subreddits"),
+    min_sentiment: Optional[float] = Query(None, ge=-1, le=1, description="Lowest sentiment score to include"),
+    max_sentiment: Optional[float] = Query(None, ge=-1, le=1, description="Highest sentiment score to include"),
+):
+    """Returns one page of the posts and comments mentioning a ticker, newest first."""
+    ticker = ticker_symbol.upper()
+    after = _decode_cursor(cursor) if cursor else None
+    subreddits = tuple(sorted(set(subreddit or [])))
+    key = ("mentions", ticker, cursor, limit, subreddits, min_sentiment, max_sentiment)
+
+    def build():
+        return build_ticker_mentions(db, ticker, after, limit, list(subreddits), min_sentiment, max_sentiment)
+    return _cached_response(request, db, key, build)
+
+def build_ticker_mentions(db: Session, ticker: str, after: Optional[tuple], limit: int, subreddit: List[str],
+                          min_sentiment: Optional[float], max_sentiment: Optional[float]):
+    """
+    Reads one page of mention keys from the mentions table, then loads the title or body
+    for just those rows with one IN query per source table.
+    """
+    sort_key = (Mention.created_utc, Mention.source_id, Mention.source_type)
+    query = select(*sort_key, Mention.region, Mention.subreddit, Mention.sentiment, Mention.upvotes).where(
+        Mention.ticker == ticker,
+        Mention.created_utc != None,
+    )
+    if after:
+        # Typed literals, so the timestamp is compared in the same format it is stored in.
+        query = query.where(tuple_(*sort_key) < tuple_(*(literal(value, column.type) for value, column in zip(after, sort_key))))
+    if subreddit:
+        query = query.where(Mention.subreddit.in_(subreddit))
+    if min_sentiment is not None:
+        query = query.where(Mention.sentiment >= min_sentiment)
+    if max_sentiment is not None:
+        query = query.where(Mention.sentiment <= max_sentiment)
+    # One extra row tells whether there is a next page.
+    rows = db.execute(query.order_by(*(column.desc() for column in sort_key)).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    post_ids = [row.source_id for row in rows if row.source_type == "post"]
+    comment_ids = [row.source_id for row in rows if row.source_type == "comment"]
+    sources = {}
+    if post_ids:
+        for post in db.execute(select(RedditPost.id, RedditPost.author, RedditPost.title).where(RedditPost.id.in_(post_ids))):
+            sources[("post", post.id)] = {"post_id": post.id, "author": post.author, "text": post.title}
+    if comment_ids:
+        for comment in db.execute(
+            select(RedditComment.id, RedditComment.post_id, RedditComment.author, RedditComment.body)
+            .where(RedditComment.id.in_(comment_ids))
+        ):
+            sources[("comment", comment.id)] = {"post_id": comment.post_id, "author": comment.author, "text": comment.body}
+
+    items = []
+    for row in rows:
+        source = sources.get((row.source_type, row.source_id), {"post_id": row.source_id, "author": None, "text": None})
+        items.append({
+            "source_type": row.source_type,
+            "id": row.source_id,
+            "created_utc": row.created_utc,
+            "subreddit": row.subreddit,
+            "region": row.region,
+            "sentiment": row.sentiment,
+            "upvotes": row.upvotes,
+            **source,
+        })
+    last = rows[-1] if rows else None
+    next_cursor = _encode_cursor(last.created_utc, last.source_id, last.source_type) if has_more else None
+    return MentionPage(ticker=ticker, items=items, next_cursor=next_cursor).dict()
+
+# --- Metrics ---
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(db: Session = Depends(get_db)):
+    """
+    Prometheus metrics: request latencies of this API process, plus the summary of the
+    latest run of each ingest job (which run in their own processes) from pipeline_runs.
+    """
+    latest = select(func.max(PipelineRun.id)).group_by(PipelineRun.job)
+    try:
+        runs = db.execute(select(PipelineRun).where(PipelineRun.id.in_(latest)).order_by(PipelineRun.job)).scalars().all()
+    except OperationalError: # No ingest job has run against this database yet
+        runs = []
+    body = metrics.registry.render() + metrics.render_run_summaries(runs)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -1,3 +1,10 @@
+"""
+config.py
+---------
+Loads API credentials from the environment (or a .env file).
+Missing credentials only raise when a client that needs them is created, so the API can
+serve stored data without any ingestion keys configured.
+"""
 import os
 from dotenv import load_dotenv
 
@@ -9,11 +16,18 @@ REDDIT_USER_AGENT = os.getenv(
     "REDDIT_USER_AGENT",
 )
 
-if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT]):
-    raise ValueError("Missing Reddit API credentials. Check your .env file.")
-
 FINNHUB_API_KEY = os.getenv("FINNHUB_API_KEY")
-if not FINNHUB_API_KEY:
-    raise ValueError("Missing Finnhub API key. Check your .env file.")
+
+def require_reddit_credentials() -> tuple[str, str, str]:
+    """Returns (client_id, client_secret, user_agent), raising if any of them is missing."""
+    if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT]):
+        raise ValueError("Missing Reddit API credentials. Check your .env file.")
+    return REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
+
+def require_finnhub_api_key() -> str:
+    """Returns the Finnhub API key, raising if it is missing."""
+    if not FINNHUB_API_KEY:
+        raise ValueError("Missing Finnhub API key. Check your .env file.")
+    return FINNHUB_API_KEY
 
 # You can add more API keys here later (e.g., Finnhub, DB URL, etc.)
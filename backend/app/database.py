@@ -1,9 +1,12 @@
 """
 database.py
 ------------
-Sets up the SQLAlchemy engine and session.
+Sets up the SQLAlchemy engines and sessions.
+There are two engine profiles: a writer used by the ingest services and a pooled,
+read-only reader used by the API. Both run SQLite in WAL mode, so readers are never
+blocked by a long ingest transaction.
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
@@ -14,9 +17,110 @@ DB_PATH = os.path.join(DB_DIRECTORY, "reddit_data.db")
 # Ensure the directory exists
 os.makedirs(DB_DIRECTORY, exist_ok=True)
 
-DATABASE_URL = f"sqlite:///{DB_PATH}"
+# DATABASE_URL can point the whole app at another SQLite file (e.g. for benchmarks).
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# --- Engine profiles ---
+# Each value can be overridden with an environment variable, e.g. SQLITE_WRITER_CACHE_SIZE.
+ENGINE_PROFILES = {
+    "writer": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL", # Safe in WAL mode; FULL fsyncs on every commit
+        "cache_size": -64000, # Negative values are KiB, i.e. 64 MB
+        "mmap_size": 268435456, # 256 MB
+        "busy_timeout": 30000, # ms to wait for a lock before failing
+        "query_only": "OFF",
+    },
+    "reader": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32000,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+        "query_only": "ON", # Any write through the API engine fails loudly
+    },
+}
+
+def _profile_pragmas(profile: str) -> dict:
+    pragmas = {}
+    for name, default in ENGINE_PROFILES[profile].items():
+        pragmas[name] = os.getenv(f"SQLITE_{profile.upper()}_{name.upper()}", default)
+    return pragmas
+
+def enable_sqlite_savepoints(engine):
+    """
+    Lets SQLAlchemy control transactions instead of the sqlite3 driver, which otherwise
+    defers BEGIN and breaks SAVEPOINT (session.begin_nested()).
+    """
+    @event.listens_for(engine, "connect")
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+def create_sqlite_engine(profile: str, url: str = DATABASE_URL, **kwargs):
+    """Creates an engine whose connections apply the pragmas of the given profile."""
+    pragmas = _profile_pragmas(profile)
+    if profile == "reader":
+        kwargs.setdefault("pool_size", 8)
+        kwargs.setdefault("max_overflow", 8)
+    new_engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+    enable_sqlite_savepoints(new_engine)
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return new_engine
+
+# The writer engine is used by the ingest services (fetcher, db_writer, financial updater).
+engine = create_sqlite_engine("writer")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The reader engine is used by the API.
+reader_engine = create_sqlite_engine("reader")
+ReaderSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=reader_engine)
+
 Base = declarative_base()
+
+def init_db(bind=None):
+    """
+    Creates missing tables and adds columns and indexes that were introduced after a table was created.
+    SQLite can add nullable columns in place, so no migration tool is needed for these.
+    """
+    from . import models # Registers every table on Base.metadata
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+def missing_schema(bind=None) -> list[str]:
+    """
+    Lists the tables and columns the models define but the database lacks, without changing
+    anything, so a read-only process can refuse to start against an outdated database.
+    """
+    from . import models # Registers every table on Base.metadata
+    inspector = inspect(bind or reader_engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            missing.append(table.name)
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in existing)
+    return missing
@@ -5,35 +5,137 @@ Main script for running development and data processing tasks.
 """
 
 from datetime import datetime
-from app.database import SessionLocal, Base, engine
+import argparse
+import os
+import time
+from sqlalchemy.orm import sessionmaker
+from app.database import SessionLocal, create_sqlite_engine, init_db
+from app.analysis.sentiment_cache import SentimentCache
+from app.metrics import pipeline_run
 from app.models import RedditComment, RedditPost
-from app.services.reddit_fetcher import fetch_posts
+from app.services.reddit_fetcher import iter_posts_concurrent, refresh_recent_posts
 from app.services.db_writer import insert_posts
+from app.services.fetch_state import load_watermarks, save_watermarks
+from app.services.rate_limit import RequestBudget
+from app.services.raw_archive import ARCHIVE_DIRECTORY, ArchiveWriter, archive_posts, iter_archive, list_segments
+from app.services.rollups import backfill_derived_tables
 from app.services.finnhub_client import get_company_profile, get_quote
 from app.services.financial_data_updater import update_all_ticker_data
 
-def run_reddit_fetcher():
-    """Initializes DB and fetches new data from Reddit."""
-    print("\n--- Fetching New Reddit Data ---")
+# Set to 1 to archive the raw payloads of every fetch for replays. Segments are never pruned,
+# so the archive grows until old segments are deleted by hand.
+ARCHIVE_RAW_PAYLOADS = os.getenv("ARCHIVE_RAW_PAYLOADS", "0") == "1"
+
+# Replays are not limited by the network, so larger chunks amortize commits better.
+REPLAY_CHUNK_SIZE = 500
+# In-memory entries of the sentiment cache used for replays into another database.
+REPLAY_CACHE_ENTRIES = 50_000
+
+# Subreddits fetched by the menu; 'firehose' fetches all new posts, 'search' only ticker mentions.
+# The scheduler daemon reads its subreddits from scheduler.json instead.
+DEFAULT_SUBREDDIT_CONFIG = {
+    "US": [
+        {"name": "stocks", "type": "firehose"},
+        {"name": "wallstreetbets", "type": "firehose"},
+    ],
+    "NO": [
+        {"name": "TollbugataBets", "type": "firehose"},
+        {"name": "norge", "type": "search"},
+    ],
+}
+
+def prepare_database():
+    """Creates missing tables and builds the derived tables for older databases."""
     print("Initializing database...")
-    Base.metadata.create_all(bind=engine)
-
-    subreddit_config = {
-        "US": [
-            {"name": "stocks", "type": "firehose"},
-            {"name": "wallstreetbets", "type": "firehose"},
-        ],
-        "NO": [
-            {"name": "TollbugataBets", "type": "firehose"},
-            {"name": "norge", "type": "search"},
-        ],
-    }
+    init_db()
+    session = SessionLocal()
+    try:
+        backfill_derived_tables(session)
+    finally:
+        session.close()
 
+def fetch_subreddits(subreddit_config: dict, limit: int = 20, budget: RequestBudget | None = None) -> set:
+    """
+    Fetches new posts for subreddit_config ({region: [{"name", "type", optional "limit"}]})
+    and writes them. budget lets a long-running caller share one Reddit request budget across runs.
+    A subreddit that fails does not stop the others; returns the (name, type) keys that failed,
+    whose watermarks are left where they were.
+    """
     print("Fetching posts...")
-    posts_to_insert = fetch_posts(subreddit_config, limit=20, include_comments=True)
-    insert_posts(posts_to_insert)
+    # Only posts newer than the previous run's watermarks are fetched.
+    watermarks = load_watermarks()
+    failures = {}
+    # Fetch subreddits and comment trees in parallel and stream posts into the writer,
+    # so each chunk is committed as soon as it is fetched. Analysis uses every core.
+    with pipeline_run("reddit_fetch") as summary:
+        posts = iter_posts_concurrent(subreddit_config, limit=limit, include_comments=True,
+                                      budget=budget, watermarks=watermarks, failures=failures)
+        if ARCHIVE_RAW_PAYLOADS:
+            with ArchiveWriter() as archive:
+                insert_posts(archive_posts(posts, archive), workers=os.cpu_count())
+            print(f"Archived {archive.posts_written} raw posts to {ARCHIVE_DIRECTORY}.")
+        else:
+            insert_posts(posts, workers=os.cpu_count())
+        save_watermarks(watermarks)
+        if failures:
+            summary["failed_subreddits"] = [f"r/{name} ({fetch_type})" for name, fetch_type in failures]
+            print(f"Failed to fetch: {', '.join(summary['failed_subreddits'])}.")
+    return set(failures)
+
+def run_reddit_fetcher():
+    """Initializes DB and fetches new data from Reddit."""
+    print("\n--- Fetching New Reddit Data ---")
+    prepare_database()
+    fetch_subreddits(DEFAULT_SUBREDDIT_CONFIG)
     print("\nReddit fetch process finished.")
 
+def run_recent_posts_refresh(max_age_hours: int = 24, budget: RequestBudget | None = None):
+    """Updates score and comment counts for recently stored posts."""
+    print("\n--- Refreshing Recent Reddit Posts ---")
+    init_db()
+    with pipeline_run("reddit_refresh"):
+        refresh_recent_posts(max_age_hours=max_age_hours, budget=budget)
+
+def run_financial_update(max_tickers: int | None = None):
+    """Updates stale financial data from Finnhub, optionally only for the max_tickers hottest tickers."""
+    with pipeline_run("finnhub_update"):
+        update_all_ticker_data(max_tickers=max_tickers)
+
+def run_archive_replay(database_path: str | None = None, archive_directory: str = ARCHIVE_DIRECTORY,
+                       workers: int | None = None):
+    """
+    Streams the raw archive back through ticker extraction, scoring and bulk writes.
+    Only missing posts and comments are inserted; stored ones keep their (fresher) metrics.
+    To reprocess everything (e.g. after changing TICKER_MAP) replay into a fresh
+    database_path and swap it in afterwards.
+    """
+    print("\n--- Replaying Raw Reddit Archive ---")
+    segments = list_segments(archive_directory)
+    if not segments:
+        print(f"No archive segments found in {archive_directory}.")
+        return
+    print(f"Replaying {len(segments)} segments from {archive_directory}...")
+
+    # A replay into another database keeps everything there, sentiment cache and run summary
+    # included, so the result is self-contained and replay timings do not depend on the main DB.
+    session_factory = cache = None
+    if database_path:
+        if os.path.exists(database_path):
+            print(f"{database_path} already exists; only posts missing from it will be analyzed.")
+        replay_engine = create_sqlite_engine("writer", url=f"sqlite:///{os.path.abspath(database_path)}")
+        init_db(bind=replay_engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=replay_engine)
+        cache = SentimentCache(max_entries=REPLAY_CACHE_ENTRIES, engine=replay_engine)
+    else:
+        init_db()
+
+    started = time.perf_counter()
+    with pipeline_run("archive_replay", session_factory=session_factory):
+        insert_posts(iter_archive(segments=segments), chunk_size=REPLAY_CHUNK_SIZE,
+                     workers=workers or os.cpu_count(), session_factory=session_factory,
+                     update_existing=False, cache=cache)
+    print(f"Replay finished in {time.perf_counter() - started:.2f}s.")
+
 def run_finnhub_test():
     """Tests the connection to the Finnhub API by fetching a company profile."""
     print("\n--- Running Finnhub API Test ---")
@@ -85,22 +187,45 @@ def main_menu():
         print("2. Test Finnhub connection")
         print("3. Update all financial data from Finnhub")
         print("4. Review latest sentiment analysis")
-        print("5. Exit")
-        choice = input("Enter your choice (1-5): ")
+        print("5. Refresh metrics of recent Reddit posts")
+        print("6. Replay raw Reddit archive into a database")
+        print("7. Exit")
+        choice = input("Enter your choice (1-7): ")
 
         if choice == '1':
             run_reddit_fetcher()
         elif choice == '2':
             run_finnhub_test()
         elif choice == '3':
-            update_all_ticker_data()
+            run_financial_update()
         elif choice == '4':
             run_sentiment_analysis_review()
         elif choice == '5':
+            run_recent_posts_refresh()
+        elif choice == '6':
+            database_path = input("Path of a fresh database (empty for the main database): ").strip()
+            run_archive_replay(database_path or None)
+        elif choice == '7':
             print("Exiting.")
             break
         else:
             print("Invalid choice. Please try again.")
 
 if __name__ == "__main__":
-    main_menu()
+    # 'python -m app.main replay [--database PATH]' replays the archive without the menu;
+    # 'python -m app.main migrate' brings the database schema up to date for the API.
+    parser = argparse.ArgumentParser(description="Market sentiment analyzer tasks.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("migrate", help="Create missing tables, columns and indexes, then exit")
+    replay_parser = subparsers.add_parser("replay", help="Replay the raw Reddit archive")
+    replay_parser.add_argument("--database", help="Write into this (fresh) SQLite file instead of the main database")
+    replay_parser.add_argument("--archive", default=ARCHIVE_DIRECTORY, help="Directory with archive segments")
+    replay_parser.add_argument("--workers", type=int, default=None, help="Analysis processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        run_archive_replay(args.database, args.archive, args.workers)
+    elif args.command == "migrate":
+        prepare_database()
+    else:
+        main_menu()
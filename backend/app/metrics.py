@@ -0,0 +1,256 @@
+"""
+metrics.py
+----------
+Minimal in-process metrics (counters and histograms with labels) rendered in the
+Prometheus text format, plus per-run summaries for the ingest jobs.
+Ingest runs in its own process, so each run's summary is also stored in the pipeline_runs
+table, where the API's /metrics endpoint picks up the latest one per job.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + "_total", self._labels(key), value) for key, value in self._values.items()]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: {"value": value} for key, value in self._values.items()}
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            index = bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                state["buckets"][index] += 1
+            state["count"] += 1
+            state["sum"] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with-block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", {**labels, "le": repr(bound)}, cumulative))
+                samples.append((self.name + "_bucket", {**labels, "le": "+Inf"}, state["count"]))
+                samples.append((self.name + "_count", labels, state["count"]))
+                samples.append((self.name + "_sum", labels, state["sum"]))
+        return samples
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: {"count": state["count"], "seconds": state["sum"]} for key, state in self._values.items()}
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None: # Modules may be reloaded; keep the first instance
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Returns {(metric name, label key): values} for computing per-run deltas."""
+        return {
+            (metric.name, key): values
+            for metric in list(self._metrics.values())
+            for key, values in metric.snapshot().items()
+        }
+
+    def labels_of(self, name: str, key: tuple) -> dict:
+        return self._metrics[name]._labels(key)
+
+registry = Registry()
+
+# --- Pipeline metrics ---
+reddit_listing_seconds = registry.histogram(
+    "reddit_listing_seconds", "Time spent waiting on Reddit listing pages per subreddit fetch.", ("subreddit", "fetch_type"))
+reddit_posts_fetched = registry.counter("reddit_posts_fetched", "Posts read from Reddit listings.", ("subreddit",))
+reddit_comment_tree_seconds = registry.histogram(
+    "reddit_comment_tree_seconds", "Time to load and walk one submission's comment tree.", ("subreddit",))
+reddit_comments_fetched = registry.counter("reddit_comments_fetched", "Comments read from Reddit.", ("subreddit",))
+analysis_seconds = registry.histogram(
+    "analysis_seconds", "CPU time per chunk for ticker extraction and sentiment scoring.", ("stage",))
+analysis_texts = registry.counter("analysis_texts", "Texts run through each analysis stage.", ("stage",))
+db_seconds = registry.histogram(
+    "db_seconds", "Time per chunk spent in database work.", ("operation",))
+ingest_rows_written = registry.counter("ingest_rows_written", "Rows inserted by insert_posts.", ("table",))
+ingest_posts = registry.counter("ingest_posts", "Posts processed by insert_posts.", ("result",))
+finnhub_request_seconds = registry.histogram(
+    "finnhub_request_seconds", "Latency of Finnhub API calls.", ("endpoint", "status"))
+finnhub_rate_limit_wait_seconds = registry.histogram(
+    "finnhub_rate_limit_wait_seconds", "Time Finnhub calls waited for the rate limiter.", ("endpoint",))
+http_request_seconds = registry.histogram(
+    "http_request_seconds", "Latency of API requests until the response starts.", ("method", "route", "status"))
+
+# --- Per-run summaries ---
+def _summary_from(before: dict, after: dict) -> dict:
+    """Turns two registry snapshots into a per-run summary of counters and timed stages."""
+    counters, stages = [], []
+    for (name, key), values in sorted(after.items()):
+        previous = before.get((name, key), {})
+        labels = registry.labels_of(name, key)
+        if "value" in values:
+            delta = values["value"] - previous.get("value", 0)
+            if delta:
+                counters.append({"metric": name, "labels": labels, "value": delta})
+        else:
+            count = values["count"] - previous.get("count", 0)
+            if count:
+                seconds = values["seconds"] - previous.get("seconds", 0.0)
+                stages.append({"metric": name, "labels": labels, "count": count, "seconds": round(seconds, 6)})
+    return {"counters": counters, "stages": stages}
+
+@contextmanager
+def pipeline_run(job: str, session_factory=None):
+    """
+    Wraps one ingest job run. Afterwards prints a structured (JSON) summary of the metrics
+    recorded during the run and stores it in pipeline_runs (of the database session_factory
+    opens, default the main one). The summary dict is yielded, so the job can add its own fields.
+    """
+    before = registry.snapshot()
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    summary = {"job": job, "started_at": started_at.isoformat()}
+    status = "error"
+    try:
+        yield summary
+        status = "ok"
+    finally:
+        summary.update(_summary_from(before, registry.snapshot()))
+        summary["status"] = status
+        summary["duration_s"] = round(time.perf_counter() - started, 6)
+        print(f"Run summary: {json.dumps(summary, default=str)}")
+        try:
+            save_run_summary(summary, started_at, session_factory)
+        except Exception as e:
+            print(f"Could not store the run summary: {e}")
+
+def save_run_summary(summary: dict, started_at: datetime, session_factory=None):
+    from .database import SessionLocal
+    from .models import PipelineRun
+
+    session = (session_factory or SessionLocal)()
+    try:
+        PipelineRun.__table__.create(bind=session.get_bind(), checkfirst=True)
+        session.add(PipelineRun(
+            job=summary["job"],
+            started_at=started_at,
+            finished_at=datetime.utcnow(),
+            status=summary["status"],
+            duration_seconds=summary["duration_s"],
+            summary=json.dumps(summary, default=str),
+        ))
+        session.commit()
+    finally:
+        session.close()
+
+def render_run_summaries(runs) -> str:
+    """Renders the latest PipelineRun per job as Prometheus gauges."""
+    lines = [
+        "# HELP pipeline_last_run_timestamp_seconds Finish time of the job's latest run.",
+        "# TYPE pipeline_last_run_timestamp_seconds gauge",
+        "# HELP pipeline_last_run_duration_seconds Duration of the job's latest run.",
+        "# TYPE pipeline_last_run_duration_seconds gauge",
+        "# HELP pipeline_last_run_success 1 if the job's latest run succeeded.",
+        "# TYPE pipeline_last_run_success gauge",
+        "# HELP pipeline_last_run_stage_seconds Seconds per instrumented stage in the job's latest run.",
+        "# TYPE pipeline_last_run_stage_seconds gauge",
+        "# HELP pipeline_last_run_count Counter increments in the job's latest run.",
+        "# TYPE pipeline_last_run_count gauge",
+    ]
+    for run in runs:
+        job = {"job": run.job}
+        summary = json.loads(run.summary or "{}")
+        finished = (run.finished_at - datetime(1970, 1, 1)).total_seconds() if run.finished_at else 0
+        lines.append(f"pipeline_last_run_timestamp_seconds{format_labels(job)} {finished}")
+        lines.append(f"pipeline_last_run_duration_seconds{format_labels(job)} {run.duration_seconds or 0}")
+        lines.append(f"pipeline_last_run_success{format_labels(job)} {1 if run.status == 'ok' else 0}")
+        for stage in summary.get("stages", []):
+            labels = {**job, "metric": stage["metric"], **stage["labels"]}
+            lines.append(f"pipeline_last_run_stage_seconds{format_labels(labels)} {stage['seconds']}")
+        for counter in summary.get("counters", []):
+            labels = {**job, "metric": counter["metric"], **counter["labels"]}
+            lines.append(f"pipeline_last_run_count{format_labels(labels)} {counter['value']}")
+    return "\n".join(lines) + "\n"
@@ -5,7 +5,7 @@ Defines database schema for Reddit posts and comments.
 """
 
 from sqlalchemy.dialects.sqlite import JSON
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -40,6 +40,7 @@ class RedditComment(Base):
     sentiment_score = Column(Float, nullable=True)
     ticker_symbol = Column(String, nullable=True, index=True)
     region = Column(String, index=True)
+    created_utc = Column(DateTime, nullable=True, index=True) # NULL for comments stored before this column existed
 
     post = relationship("RedditPost", back_populates="comments")
     # Self-referential relationship for comment replies
@@ -59,3 +60,84 @@ class TickerData(Base):
     pe_ratio = Column(Float, nullable=True)
     market_cap = Column(Float, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    profile_updated = Column(DateTime, nullable=True) # Profiles rarely change and have a long TTL
+    quote_updated = Column(DateTime, nullable=True)
+
+class CachedSentiment(Base):
+    __tablename__ = "sentiment_cache"
+
+    text_hash = Column(String, primary_key=True) # Hash of the normalized text and scorer version
+    sentiment_score = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class FetchWatermark(Base):
+    __tablename__ = "fetch_watermarks"
+
+    subreddit = Column(String, primary_key=True)
+    fetch_type = Column(String, primary_key=True) # 'firehose' or 'search'
+    newest_created_utc = Column(DateTime)
+    newest_post_id = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SentimentRollup(Base):
+    """Pre-aggregated comment sentiment per ticker, region, subreddit and hour."""
+    __tablename__ = "sentiment_rollup"
+
+    ticker = Column(String, primary_key=True)
+    region = Column(String, primary_key=True)
+    subreddit = Column(String, primary_key=True) # '' when the comment's post is unknown
+    bucket_start = Column(DateTime, primary_key=True) # Start of the hour the mention was created in
+    mention_count = Column(Integer, default=0)
+    sentiment_sum = Column(Float, default=0.0)
+    sentiment_count = Column(Integer, default=0) # Mentions with a score, the divisor for the average
+
+class DataGeneration(Base):
+    """Counter bumped by every ingest or financial update, used to invalidate API response caches."""
+    __tablename__ = "data_generation"
+
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Mention(Base):
+    """
+    Narrow fact table with one row per ticker mentioned in a post or comment.
+    Covering indexes let report-style aggregations run without touching the text-heavy tables.
+    """
+    __tablename__ = "mentions"
+
+    source_id = Column(String, primary_key=True) # Post or comment id
+    source_type = Column(String, primary_key=True) # 'post' or 'comment'
+    ticker = Column(String, primary_key=True)
+    region = Column(String)
+    subreddit = Column(String)
+    created_utc = Column(DateTime)
+    sentiment = Column(Float, nullable=True)
+    upvotes = Column(Integer)
+    updated_generation = Column(Integer, nullable=True) # Data generation of the last upvotes change; NULL if never changed
+
+    __table_args__ = (
+        # GROUP BY ticker, region over everything
+        Index("ix_mentions_ticker_region_cover", "ticker", "region", "sentiment", "upvotes"),
+        # WHERE subreddit IN (...) GROUP BY ticker, region
+        Index("ix_mentions_subreddit_cover", "subreddit", "ticker", "region", "sentiment", "upvotes"),
+        # Time-windowed filters (recent mention volume, time buckets)
+        Index("ix_mentions_created_cover", "created_utc", "ticker", "region", "sentiment"),
+        # Keyset pagination of one ticker's mentions on (created_utc, source_id), with the
+        # drill-down filters in the index so they are checked without reading the table
+        Index("ix_mentions_ticker_keyset", "ticker", "created_utc", "source_id", "source_type", "subreddit", "sentiment"),
+        # Upvote changes since a generation, for the API's in-memory analytics store
+        Index("ix_mentions_updated_generation", "updated_generation"),
+    )
+
+class PipelineRun(Base):
+    """One finished ingest job run with its structured metrics summary (see metrics.pipeline_run)."""
+    __tablename__ = "pipeline_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job = Column(String, index=True) # e.g. 'reddit_fetch', 'finnhub_update'
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime, index=True)
+    status = Column(String) # 'ok' or 'error'
+    duration_seconds = Column(Float)
+    summary = Column(Text) # JSON: counters and per-stage seconds recorded during the run
@@ -0,0 +1,140 @@
+"""
+report_stream.py
+----------------
+Pushes report changes to clients over Server-Sent Events.
+The ingest jobs run in other processes, so the broadcaster polls the data generation
+(one single-row read) and, when it moves, recomputes the report once per subscribed
+filter and sends every subscriber of that filter only the rows that changed.
+"""
+import asyncio
+
+import orjson
+
+from .database import ReaderSessionLocal
+from .services.data_generation import get_data_generation
+
+# Seconds between data generation checks.
+POLL_INTERVAL = 1.0
+# Seconds between keep-alive comments, so proxies do not close idle connections.
+KEEPALIVE_INTERVAL = 15.0
+# Events buffered per subscriber; a client that falls further behind is disconnected
+# and its EventSource reconnects with a fresh snapshot.
+SUBSCRIBER_QUEUE_SIZE = 100
+
+def _row_key(row: dict) -> tuple:
+    return row["ticker"], row["region"]
+
+def diff_rows(previous: dict, current: dict) -> dict:
+    """Returns {"changed": [...], "removed": [...]} between two {(ticker, region): row} maps."""
+    changed = [row for key, row in current.items() if previous.get(key) != row]
+    removed = [{"ticker": ticker, "region": region} for ticker, region in previous.keys() - current.keys()]
+    return {"changed": changed, "removed": removed}
+
+def format_event(event: str, data, event_id=None) -> bytes:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {orjson.dumps(data).decode('utf-8')}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+class ReportBroadcaster:
+    """
+    Fans report deltas out to SSE subscribers, grouped by subreddit filter.
+    build_rows(db, subreddits) must return the report rows as dicts (see api.build_sentiment_report).
+    """
+
+    def __init__(self, build_rows, poll_interval: float = POLL_INTERVAL):
+        self.build_rows = build_rows
+        self.poll_interval = poll_interval
+        self._subscribers = {} # subreddit filter -> set of queues
+        self._snapshots = {} # subreddit filter -> {(ticker, region): row}
+        self._generation = None
+        self._task = None
+
+    def _load(self, filters: list[tuple]) -> tuple[int, dict]:
+        """Reads the generation and the report for each filter (runs in a worker thread)."""
+        db = ReaderSessionLocal()
+        try:
+            generation = get_data_generation(db)
+            if generation == self._generation:
+                return generation, {}
+            return generation, {
+                subreddits: {_row_key(row): row for row in self.build_rows(db, list(subreddits))}
+                for subreddits in filters
+            }
+        finally:
+            db.close()
+
+    async def subscribe(self, subreddits: tuple) -> asyncio.Queue:
+        """Registers a subscriber and queues a snapshot of its filtered report as the first event."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        snapshot = self._snapshots.get(subreddits)
+        if snapshot is None:
+            db = ReaderSessionLocal()
+            try:
+                rows = await asyncio.to_thread(self.build_rows, db, list(subreddits))
+            finally:
+                db.close()
+            snapshot = self._snapshots.setdefault(subreddits, {_row_key(row): row for row in rows})
+        queue.put_nowait(format_event("snapshot", list(snapshot.values()), self._generation))
+        self._subscribers.setdefault(subreddits, set()).add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, subreddits: tuple, queue: asyncio.Queue):
+        queues = self._subscribers.get(subreddits)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                # Nobody watches this filter any more, so stop maintaining its snapshot.
+                del self._subscribers[subreddits]
+                self._snapshots.pop(subreddits, None)
+
+    async def _poll(self):
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                generation, reports = await asyncio.to_thread(self._load, list(self._subscribers))
+            except Exception as e:
+                print(f"Report stream: failed to poll for changes: {e}")
+                continue
+            if generation == self._generation:
+                continue
+            self._generation = generation
+            for subreddits, current in reports.items():
+                previous = self._snapshots.get(subreddits)
+                if previous is None: # Unsubscribed while the report was being built
+                    continue
+                self._snapshots[subreddits] = current
+                delta = diff_rows(previous, current)
+                if delta["changed"] or delta["removed"]:
+                    self._publish(subreddits, format_event("delta", delta, generation))
+
+    def _publish(self, subreddits: tuple, event: bytes):
+        """Queues one pre-encoded event for every subscriber of a filter."""
+        for queue in list(self._subscribers.get(subreddits, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Replace the backlog with an end-of-stream marker for this slow client.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.unsubscribe(subreddits, queue)
+
+    async def events(self, request, subreddits: tuple):
+        """Async generator of SSE bytes for one client, ending when it disconnects."""
+        queue = await self.subscribe(subreddits)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            self.unsubscribe(subreddits, queue)
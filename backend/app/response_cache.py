@@ -0,0 +1,98 @@
+"""
+response_cache.py
+-----------------
+In-process cache for API responses, invalidated by the data generation counter.
+Payloads are stored already serialized (orjson) and compressed variants are added per
+content encoding the first time a client asks for them.
+"""
+from collections import OrderedDict
+import gzip
+import hashlib
+import threading
+
+import orjson
+
+try:
+    import brotli # Optional: pip install brotli to serve br-encoded responses
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the headers would outweigh the savings.
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def make_etag(generation: int, key: tuple) -> str:
+    """Builds an ETag from the data generation and the normalized request key."""
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).hexdigest()
+    return f'W/"{generation}-{digest}"'
+
+def encode_json(payload) -> bytes:
+    """Serializes a payload of plain dicts, lists and datetimes."""
+    return orjson.dumps(payload)
+
+def negotiate_encoding(accept_encoding: str, size: int) -> str:
+    """Picks br, gzip or identity from an Accept-Encoding header (q-values of 0 are honored)."""
+    if size < MIN_COMPRESS_SIZE:
+        return "identity"
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return "identity"
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+class CachedBody:
+    """A serialized response body plus its compressed variants, built on demand."""
+
+    def __init__(self, payload):
+        self._variants = {"identity": encode_json(payload)}
+
+    @property
+    def size(self) -> int:
+        return len(self._variants["identity"])
+
+    def get(self, encoding: str) -> bytes:
+        body = self._variants.get(encoding)
+        if body is None:
+            # Two threads may compress the same body at once; both results are identical.
+            body = self._variants[encoding] = compress(self._variants["identity"], encoding)
+        return body
+
+class ResponseCache:
+    """
+    Maps a normalized request key to (generation, payload). An entry is only returned if it was
+    computed for the current generation, so a bump invalidates everything at once.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, generation: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, generation: int, payload):
+        with self._lock:
+            self._entries[key] = (generation, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,292 @@
+"""
+scheduler.py
+------------
+Headless ingest daemon driven by a declarative config file (see backend/scheduler.json).
+Every subreddit has its own polling interval and priority; the Finnhub update and the
+recent-post refresh run as separate periodic jobs. Jobs run one at a time, so runs never
+overlap, and a file lock keeps a second daemon from starting. Failed jobs are retried with
+jittered exponential backoff. SIGINT/SIGTERM stop the daemon once the current job is done.
+
+    python -m app.scheduler                       # uses backend/scheduler.json
+    python -m app.scheduler --config my.json --once
+"""
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import random
+import signal
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows; the single-instance lock is skipped there
+    fcntl = None
+
+from .database import DB_DIRECTORY
+from .services.rate_limit import RequestBudget
+
+DEFAULT_CONFIG_PATH = os.getenv(
+    "SCHEDULER_CONFIG", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scheduler.json")
+)
+LOCK_PATH = os.path.join(DB_DIRECTORY, "scheduler.lock")
+
+# Longest the loop sleeps between checks for due jobs.
+MAX_IDLE_SECONDS = 60
+
+SUBREDDIT_TYPES = ("firehose", "search")
+PERIODIC_JOBS = ("finnhub_update", "reddit_refresh")
+DEFAULT_BACKOFF = {"base_seconds": 30, "max_seconds": 1800, "jitter": 0.5}
+
+class Job:
+    """One scheduled unit of work: a subreddit fetch or a periodic job."""
+
+    def __init__(self, name: str, kind: str, interval: float, priority: int, options: dict):
+        self.name = name
+        self.kind = kind # 'subreddit' or one of PERIODIC_JOBS
+        self.interval = interval # Seconds between the end of one run and the start of the next
+        self.priority = priority # Lower runs first when several jobs are due
+        self.options = options
+        self.next_run = 0.0 # Monotonic time; 0 means due at startup
+        self.failures = 0
+
+    def __repr__(self):
+        return f"Job({self.name!r}, every {self.interval:.0f}s, priority {self.priority})"
+
+# --- Config ---
+def _positive(value, field: str, name: str) -> float:
+    if not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{name}: '{field}' must be a positive number, got {value!r}.")
+    return value
+
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> dict:
+    """
+    Reads and validates the scheduler config. Returns {"jobs": [Job], "backoff": {...},
+    "reddit_requests_per_minute": int}. Raises ValueError on invalid entries.
+    """
+    with open(path) as f:
+        raw = json.load(f)
+
+    defaults = {"interval_minutes": 30, "priority": 5, "limit": 20, **raw.get("subreddit_defaults", {})}
+    jobs = []
+    seen = set()
+    for entry in raw.get("subreddits", []):
+        entry = {**defaults, **entry}
+        name = entry.get("name")
+        if not name or not entry.get("region"):
+            raise ValueError(f"Subreddit entries need a 'name' and a 'region': {entry!r}")
+        if entry.get("type", "firehose") not in SUBREDDIT_TYPES:
+            raise ValueError(f"r/{name}: 'type' must be one of {SUBREDDIT_TYPES}.")
+        key = (name, entry.get("type", "firehose"))
+        if key in seen:
+            raise ValueError(f"r/{name} ({key[1]}) is configured twice.")
+        seen.add(key)
+        if not entry.get("enabled", True):
+            continue
+        interval = _positive(entry["interval_minutes"], "interval_minutes", f"r/{name}") * 60
+        options = {"name": name, "region": entry["region"], "type": key[1],
+                   "limit": int(_positive(entry["limit"], "limit", f"r/{name}"))}
+        jobs.append(Job(f"r/{name} ({key[1]})", "subreddit", interval, int(entry["priority"]), options))
+
+    for kind, entry in raw.get("jobs", {}).items():
+        if kind not in PERIODIC_JOBS:
+            raise ValueError(f"Unknown job '{kind}'; expected one of {PERIODIC_JOBS}.")
+        if not entry.get("enabled", True):
+            continue
+        interval = _positive(entry.get("interval_minutes"), "interval_minutes", kind) * 60
+        options = {k: v for k, v in entry.items() if k not in ("interval_minutes", "priority", "enabled")}
+        jobs.append(Job(kind, kind, interval, int(entry.get("priority", 5)), options))
+
+    if not jobs:
+        raise ValueError(f"{path} does not enable any jobs.")
+    backoff = {**DEFAULT_BACKOFF, **raw.get("backoff", {})}
+    if not 0 <= backoff["jitter"] <= 1:
+        raise ValueError("backoff.jitter must be between 0 and 1.")
+    return {
+        "jobs": jobs,
+        "backoff": backoff,
+        "reddit_requests_per_minute": int(raw.get("reddit_requests_per_minute", 60)),
+    }
+
+def backoff_delay(failures: int, base_seconds: float, max_seconds: float, jitter: float) -> float:
+    """
+    Exponential backoff after the given number of consecutive failures, capped at max_seconds.
+    Up to the jitter fraction of the delay is randomized, so failing jobs do not retry in lockstep.
+    """
+    delay = min(max_seconds, base_seconds * 2 ** (failures - 1))
+    return delay * (1 - jitter) + random.uniform(0, delay * jitter)
+
+# --- Job runners ---
+def _subreddit_config(jobs: list[Job]) -> dict:
+    """Builds the {region: [config]} mapping fetch_subreddits expects, in priority order."""
+    config = {}
+    for job in sorted(jobs, key=lambda job: job.priority):
+        options = job.options
+        config.setdefault(options["region"], []).append(
+            {"name": options["name"], "type": options["type"], "limit": options["limit"]}
+        )
+    return config
+
+def default_runners(reddit_budget: RequestBudget) -> dict:
+    """
+    Maps job kinds to callables taking the list of due jobs of that kind. A runner may return
+    the jobs that failed; raising fails every job it was given.
+    """
+    # Imported here so loading and validating a config does not pull in the whole pipeline.
+    from .main import fetch_subreddits, run_financial_update, run_recent_posts_refresh
+
+    def run_finnhub(jobs):
+        run_financial_update(max_tickers=jobs[0].options.get("max_tickers"))
+
+    def run_refresh(jobs):
+        run_recent_posts_refresh(max_age_hours=jobs[0].options.get("max_age_hours", 24), budget=reddit_budget)
+
+    def run_subreddits(jobs):
+        failed = fetch_subreddits(_subreddit_config(jobs), budget=reddit_budget)
+        return [job for job in jobs if (job.options["name"], job.options["type"]) in failed]
+
+    return {
+        "subreddit": run_subreddits,
+        "finnhub_update": run_finnhub,
+        "reddit_refresh": run_refresh,
+    }
+
+# --- Scheduler ---
+class Scheduler:
+    """
+    Runs due jobs one at a time, most urgent (lowest priority value) first. Subreddit jobs
+    that are due together, up to the priority of the next due periodic job, are fetched in
+    one run, so they share the fetch thread pool.
+    The next run is scheduled from when a run finishes, so a slow run delays its job
+    instead of piling up.
+    """
+
+    def __init__(self, jobs: list[Job], runners: dict, backoff: dict | None = None, clock=time.monotonic):
+        self.jobs = jobs
+        self.runners = runners
+        self.backoff = {**DEFAULT_BACKOFF, **(backoff or {})}
+        self.clock = clock
+        self.stop_event = threading.Event()
+
+    def due_jobs(self, now: float) -> list[Job]:
+        return sorted((job for job in self.jobs if job.next_run <= now), key=lambda job: (job.priority, job.next_run))
+
+    def _next_batch(self, due: list[Job]) -> list[Job]:
+        """
+        The most urgent due job, plus every due subreddit that is not less urgent than the
+        next due periodic job, so a low-priority subreddit never jumps ahead of e.g. Finnhub.
+        """
+        first = due[0]
+        if first.kind != "subreddit":
+            return [first]
+        cutoff = min((job.priority for job in due if job.kind != "subreddit"), default=None)
+        return [job for job in due if job.kind == "subreddit" and (cutoff is None or job.priority <= cutoff)]
+
+    def _schedule(self, job: Job, succeeded: bool, finished: float):
+        if succeeded:
+            job.failures = 0
+            job.next_run = finished + job.interval
+        else:
+            job.failures += 1
+            delay = backoff_delay(job.failures, **self.backoff)
+            job.next_run = finished + delay
+            print(f"Scheduler: retrying {job.name} in {delay:.0f}s (failure {job.failures}).")
+
+    def run_batch(self, batch: list[Job]) -> bool:
+        """
+        Runs one batch of jobs of the same kind and schedules their next runs. Returns success.
+        Only the jobs the runner reports as failed back off (all of them if it raises), so a
+        failing subreddit does not hold back the others fetched with it.
+        """
+        names = ", ".join(job.name for job in batch)
+        print(f"\n--- Scheduler: running {names} ---")
+        try:
+            failed = self.runners[batch[0].kind](batch) or []
+        except Exception as e:
+            print(f"Scheduler: {names} failed: {e}")
+            failed = batch
+
+        finished = self.clock()
+        for job in batch:
+            self._schedule(job, job not in failed, finished)
+        return not failed
+
+    def run_pending(self) -> int:
+        """Runs every job that is due now, re-checking after each batch. Returns the number of batches."""
+        batches = 0
+        while not self.stop_event.is_set():
+            due = self.due_jobs(self.clock())
+            if not due:
+                break
+            self.run_batch(self._next_batch(due))
+            batches += 1
+        return batches
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            self.run_pending()
+            if self.stop_event.is_set():
+                break
+            wait = min(job.next_run for job in self.jobs) - self.clock()
+            self.stop_event.wait(min(max(wait, 0), MAX_IDLE_SECONDS))
+        print("Scheduler stopped.")
+
+    def stop(self):
+        self.stop_event.set()
+
+def install_signal_handlers(scheduler: Scheduler):
+    """The first SIGINT/SIGTERM stops the scheduler after the current job; a second one aborts it."""
+    def handle(signum, frame):
+        if scheduler.stop_event.is_set():
+            raise KeyboardInterrupt
+        print(f"\nReceived {signal.Signals(signum).name}; stopping after the current job (repeat to abort).")
+        scheduler.stop()
+
+    signal.signal(signal.SIGINT, handle)
+    signal.signal(signal.SIGTERM, handle)
+
+@contextmanager
+def single_instance_lock(path: str = LOCK_PATH):
+    """Holds an exclusive lock on path for the daemon's lifetime; raises if another daemon has it."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a+") as lock_file: # Not "w": that would clear the running daemon's pid
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"Another scheduler is already running (lock held on {path}).")
+        lock_file.truncate(0)
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_scheduler(config_path: str = DEFAULT_CONFIG_PATH, once: bool = False):
+    """Loads the config and runs the daemon; with once, runs every enabled job once and exits."""
+    config = load_config(config_path)
+    print(f"Loaded {len(config['jobs'])} jobs from {config_path}:")
+    for job in sorted(config["jobs"], key=lambda job: job.priority):
+        print(f"  {job}")
+
+    with single_instance_lock():
+        from .main import prepare_database
+        prepare_database()
+        # One Reddit budget for the daemon's lifetime, so back-to-back runs cannot burst past it.
+        reddit_budget = RequestBudget(config["reddit_requests_per_minute"])
+        scheduler = Scheduler(config["jobs"], default_runners(reddit_budget), config["backoff"])
+        install_signal_handlers(scheduler)
+        if once:
+            scheduler.run_pending()
+        else:
+            scheduler.run_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ingest scheduler daemon.")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="Path of the scheduler config (JSON)")
+    parser.add_argument("--once", action="store_true", help="Run every job once and exit")
+    args = parser.parse_args()
+    run_scheduler(args.config, once=args.once)
@@ -5,13 +5,15 @@ Pydantic models for API data validation and serialization.
 """
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 
 class ReportRow(BaseModel):
     ticker: str
     region: str
     name: Optional[str]
     mentions: int
-    avg_sentiment: float
+    avg_sentiment: Optional[float]
+    weighted_sentiment: Optional[float] = None # Upvote-weighted average sentiment
     current_price: Optional[float]
     price_change: Optional[float]
     price_percent_change: Optional[float]
@@ -34,4 +36,33 @@ class TickerDetails(BaseModel):
     name: str
     quote: QuoteData
     pe_ratio: Optional[float]
-    market_cap: Optional[float]
\ No newline at end of file
+    market_cap: Optional[float]
+
+class TimeseriesPoint(BaseModel):
+    bucket_start: datetime
+    mentions: int
+    avg_sentiment: Optional[float]
+
+class TickerTimeseries(BaseModel):
+    ticker: str
+    interval: str # 'hour' or 'day'
+    start: datetime
+    end: datetime
+    points: List[TimeseriesPoint] # Only buckets with at least one mention, oldest first
+
+class MentionItem(BaseModel):
+    source_type: str # 'post' or 'comment'
+    id: str
+    post_id: str # The post itself, or the post a comment belongs to
+    created_utc: datetime
+    subreddit: Optional[str]
+    region: str
+    sentiment: Optional[float]
+    upvotes: Optional[int]
+    author: Optional[str]
+    text: Optional[str] # Post title or comment body
+
+class MentionPage(BaseModel):
+    ticker: str
+    items: List[MentionItem] # Newest first
+    next_cursor: Optional[str] # Pass as cursor to get the next page; None on the last page
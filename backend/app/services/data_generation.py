@@ -0,0 +1,40 @@
+"""
+data_generation.py
+------------------
+A persistent counter that changes whenever report data changes. Writers bump it in the
+same transaction as their data; API processes compare it to decide if cached responses are stale.
+"""
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from ..models import DataGeneration
+
+GENERATION_NAME = "report"
+
+# Bumped whenever the mentions table is rebuilt from scratch (its rowids start over).
+MENTIONS_REBUILD_NAME = "mentions_rebuild"
+
+def bump_data_generation(session, name: str = GENERATION_NAME):
+    """Increments the generation inside the caller's transaction."""
+    table = DataGeneration.__table__
+    stmt = sqlite_insert(table).values(name=name, generation=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"generation": table.c.generation + 1, "updated_at": stmt.excluded.updated_at},
+    )
+    session.execute(stmt)
+
+def get_data_generation(session, name: str = GENERATION_NAME) -> int:
+    """Returns the current generation (0 if nothing has been written yet)."""
+    generation = session.execute(
+        select(DataGeneration.generation).where(DataGeneration.name == name)
+    ).scalar()
+    return generation or 0
+
+def next_data_generation():
+    """
+    SQL expression for the generation the caller's transaction will commit as, for rows
+    written before its bump_data_generation call.
+    """
+    current = select(DataGeneration.generation).where(DataGeneration.name == GENERATION_NAME).scalar_subquery()
+    return func.coalesce(current, 0) + 1
@@ -2,139 +2,490 @@
 db_writer.py
 ------------
 Handles inserting fetched Reddit data into the database while avoiding duplicates.
+Writes are done in bulk: known ids are prefetched with IN queries, new rows are
+inserted with executemany and metric changes are applied with bulk UPDATEs.
+Posts are consumed in chunks and each chunk is committed on its own.
 """
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice
+import multiprocessing
+import signal
+import time
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.exc import IntegrityError
-from ..database import SessionLocal
-from ..models import RedditPost, RedditComment
-from ..analysis.sentiment import analyze_sentiment
-from ..analysis.tickers import extract_tickers
+from .. import metrics
+from ..database import SessionLocal, engine
+from ..models import Mention, RedditPost, RedditComment
+from ..analysis.analyzer import analyze_records
+from ..analysis.sentiment_cache import SentimentCache, text_hash
+from .data_generation import bump_data_generation, next_data_generation
+from .rollups import add_mention, apply_rollup_deltas
 
+# Shared across runs so repeated texts (bot replies, copypasta) are scored only once.
+sentiment_cache = SentimentCache(max_entries=50_000, engine=engine)
 
-def insert_posts(posts):
-    """Insert new Reddit posts and comments, skipping duplicates."""
-    session = SessionLocal()
+# Number of posts written and committed together.
+DEFAULT_CHUNK_SIZE = 50
+
+# Keeps IN (...) lists well below SQLite's bound-parameter limit.
+_IN_CHUNK_SIZE = 500
+
+def analyze_sentiment(text: str) -> float:
+    """Scores text through the shared sentiment cache."""
+    return sentiment_cache.score(text)
+
+def _chunked(items, size=_IN_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _prefetch_posts(session, post_ids) -> dict:
+    """Returns {post_id: row} for the posts that already exist."""
+    existing = {}
+    for chunk in _chunked(post_ids):
+        rows = session.execute(
+            select(
+                RedditPost.id, RedditPost.subreddit, RedditPost.region, RedditPost.ticker_symbol,
+                RedditPost.created_utc, RedditPost.upvotes, RedditPost.num_comments,
+            )
+            .where(RedditPost.id.in_(chunk))
+        )
+        existing.update({row.id: row for row in rows})
+    return existing
+
+def _prefetch_comment_upvotes(session, comment_ids) -> dict:
+    """Returns {comment_id: upvotes} for the comments that already exist."""
+    existing = {}
+    for chunk in _chunked(comment_ids):
+        rows = session.execute(select(RedditComment.id, RedditComment.upvotes).where(RedditComment.id.in_(chunk)))
+        existing.update({row.id: row.upvotes for row in rows})
+    return existing
+
+def _diff_chunk(session, posts, update_existing: bool = True, cache: SentimentCache | None = None) -> dict:
+    """
+    Diffs a batch of fetched posts against the database (the writer's read step).
+    Returns a plan with the metric updates for stored rows (none unless update_existing)
+    and one analysis record per post (see analyzer.analyze_records) covering only the
+    posts and comments that are new.
+    Cached sentiment scores are looked up here (in cache, default the shared one), so workers
+    only score unseen texts.
+    """
+    cache = cache or sentiment_cache
+    # De-duplicate within the batch (a post can show up in both a firehose and a search).
+    unique_posts = {}
+    for post_data in posts:
+        unique_posts.setdefault(post_data["id"], post_data)
+
+    existing_posts = _prefetch_posts(session, unique_posts.keys())
+    comment_ids = {c_data["id"] for post_data in unique_posts.values() for c_data in post_data.get("comments", [])}
+    existing_comments = _prefetch_comment_upvotes(session, comment_ids)
+
+    entries, post_updates, comment_updates = [], [], []
+    seen_comments = set()
+    for post_id, post_data in unique_posts.items():
+        existing_post = existing_posts.get(post_id)
+        if existing_post and update_existing:
+            # Update existing post's metrics
+            if (existing_post.upvotes, existing_post.num_comments) != (post_data["upvotes"], post_data["num_comments"]):
+                post_updates.append({"b_id": post_id, "b_upvotes": post_data["upvotes"], "b_num_comments": post_data["num_comments"]})
+
+        new_comments = []
+        for c_data in post_data.get("comments", []):
+            c_id = c_data["id"]
+            if c_id in seen_comments:
+                continue
+            seen_comments.add(c_id)
+            if c_id in existing_comments:
+                # Update upvotes on existing comment
+                if update_existing and existing_comments[c_id] != c_data["upvotes"]:
+                    comment_updates.append({"b_id": c_id, "b_upvotes": c_data["upvotes"]})
+                continue
+            new_comments.append(c_data)
+
+        # Combine title and selftext for analysis
+        post_text = None if existing_post else f"{post_data['title']} {post_data['selftext']}"
+        entries.append({
+            "post_data": post_data,
+            "existing": existing_post,
+            "new_comments": new_comments,
+            "post_key": text_hash(post_text) if post_text is not None else None,
+            "comment_keys": [text_hash(c_data["body"]) for c_data in new_comments],
+            "post_text": post_text,
+        })
+
+    keys = [entry["post_key"] for entry in entries if entry["post_key"]]
+    keys += [key for entry in entries for key in entry["comment_keys"]]
+    memory_scores, persistent_scores = cache.lookup_many(keys)
+    cached = {**persistent_scores, **memory_scores}
+
+    records = []
+    for entry in entries:
+        existing_post = entry["existing"]
+        records.append({
+            "post_text": entry["post_text"],
+            "post_ticker": (existing_post.ticker_symbol, existing_post.region) if existing_post and existing_post.ticker_symbol else None,
+            "post_score": cached.get(entry["post_key"]),
+            "comments": [(c_data["body"], cached.get(key)) for c_data, key in zip(entry["new_comments"], entry["comment_keys"])],
+        })
+
+    return {
+        "entries": entries,
+        "records": records,
+        "persistent_keys": set(persistent_scores),
+        "post_updates": post_updates,
+        "comment_updates": comment_updates,
+    }
+
+def _assemble_rows(plan: dict, results: list[dict], cache: SentimentCache | None = None) -> dict:
+    """
+    Turns a diff plan and its analysis results into the rows to write.
+    Returns a dict with new_posts, new_comments, new_mentions, post_updates, comment_updates,
+    rollup_deltas, added_count and updated_count.
+    """
+    new_posts, new_comments = [], []
+    mention_sources = [] # (row, source_type, tickers, subreddit, created_utc) for the mentions table
+    computed = {}
+    hits = persistent_hits = 0
     added_count = 0
     updated_count = 0
 
-    try:
-        for post_data in posts:
-            # Check if post already exists
-            existing_post = session.get(RedditPost, post_data["id"])
-
-            # --- Efficient Analysis Step ---
-            # Combine title and selftext for analysis
-            post_text_to_analyze = f"{post_data['title']} {post_data['selftext']}"
-            found_tickers = extract_tickers(post_text_to_analyze)
-            
-            sentiment_score = None
-            ticker_symbol = None
+    def count_score(key, was_computed, score):
+        nonlocal hits, persistent_hits
+        if was_computed:
+            computed[key] = score
+        elif key in plan["persistent_keys"]:
+            persistent_hits += 1
+        else:
+            hits += 1
+
+    for entry, result in zip(plan["entries"], results):
+        post_data = entry["post_data"]
+        post_id = post_data["id"]
+        existing_post = entry["existing"]
+
+        if existing_post:
+            post_ticker_symbol = existing_post.ticker_symbol
+            post_region = existing_post.region
+            post_subreddit, post_created = existing_post.subreddit, existing_post.created_utc
+            updated_count += 1
+        else:
+            found_tickers = result["post_tickers"]
+            post_ticker_symbol = None
             # The post's region defaults to the subreddit's region, but can be overridden by a ticker.
             post_region = post_data["region"]
             if found_tickers:
-                ticker_symbol, post_region = found_tickers[0] # (ticker, region)
-                sentiment_score = analyze_sentiment(post_text_to_analyze)
-
-            if existing_post:
-                # Update existing post's metrics
-                existing_post.upvotes = post_data["upvotes"]
-                existing_post.num_comments = post_data["num_comments"]
-
-                # --- Logic to sync comments ---
-                existing_comments = {c.id: c for c in existing_post.comments}
-                fetched_comments_map = {c_data['id']: c_data for c_data in post_data.get("comments", [])}
-
-                # Update existing comments and add new ones
-                for c_id, c_data in fetched_comments_map.items():
-                    if c_id in existing_comments:
-                        # Update upvotes on existing comment
-                        existing_comments[c_id].upvotes = c_data["upvotes"]
-                    else:
-                        # Prioritize ticker in comment, else inherit from post.
-                        comment_tickers = extract_tickers(c_data["body"])
-                        comment_sentiment = None
-                        comment_ticker_symbol = None
-                        comment_region = existing_post.region # Default to post's region
-
-                        if comment_tickers:
-                            comment_ticker_symbol, comment_region = comment_tickers[0]
-                            comment_sentiment = analyze_sentiment(c_data["body"])
-                        elif existing_post.ticker_symbol:
-                            # Inherit ticker and region from post if comment has no ticker
-                            comment_ticker_symbol = existing_post.ticker_symbol
-                            comment_sentiment = analyze_sentiment(c_data["body"])
-
-                        # Add new comment
-                        new_comment = RedditComment(
-                            id=c_data["id"],
-                            author=c_data["author"],
-                            body=c_data["body"],
-                            upvotes=c_data["upvotes"],
-                            parent_id=c_data.get("parent_id"),
-                            region=comment_region,
-                            post=existing_post,
-                            sentiment_score=comment_sentiment,
-                            ticker_symbol=comment_ticker_symbol,
-                        )
-                        existing_post.comments.append(new_comment)
-                session.add(existing_post)
-                updated_count += 1
-            else:
-                # Insert new post
-                new_post = RedditPost(
-                    id=post_data["id"],
-                    subreddit=post_data["subreddit"],
-                    region=post_region,
-                    title=post_data["title"],
-                    author=post_data["author"],
-                    url=post_data["url"],
-                    created_utc=datetime.fromisoformat(post_data["created_utc"]),
-                    upvotes=post_data["upvotes"],
-                    num_comments=post_data["num_comments"],
-                    selftext=post_data["selftext"],
-                    sentiment_score=sentiment_score,
-                    ticker_symbol=ticker_symbol,
-                )
-
-                # Process and link all comments for the new post
-                comment_map = {}
-                for c_data in post_data.get("comments", []):
-                    # Prioritize ticker in comment, else inherit from post.
-                    comment_tickers = extract_tickers(c_data["body"])
-                    comment_sentiment = None
-                    comment_ticker_symbol = None
-                    comment_region = post_region # Default to post's region
-
-                    if comment_tickers:
-                        comment_ticker_symbol, comment_region = comment_tickers[0]
-                        comment_sentiment = analyze_sentiment(c_data["body"])
-                    elif ticker_symbol: # Inherit from the new post
-                        comment_ticker_symbol = ticker_symbol
-                        comment_sentiment = analyze_sentiment(c_data["body"])
-
-                    comment = RedditComment(id=c_data["id"], author=c_data["author"], body=c_data["body"], upvotes=c_data["upvotes"], sentiment_score=comment_sentiment, ticker_symbol=comment_ticker_symbol, region=comment_region)
-                    comment_map[comment.id] = comment
-
-                # Establish relationships after creating all comment objects
-                for c_data in post_data.get("comments", []):
-                    comment = comment_map[c_data["id"]]
-                    parent_id = c_data.get("parent_id")
-                    if parent_id:
-                        parent_comment = comment_map.get(parent_id)
-                        if parent_comment:
-                            comment.parent = parent_comment
-                    else:
-                        # Only top-level comments are linked directly to the post
-                        comment.post = new_post
-                
-                session.add(new_post)
-                added_count += 1
-
-        session.commit()
-        print(f"Inserted {added_count} new posts and updated {updated_count} existing posts.")
+                post_ticker_symbol, post_region = found_tickers[0] # (ticker, region)
+
+            post_row = {
+                "id": post_id,
+                "subreddit": post_data["subreddit"],
+                "region": post_region,
+                "title": post_data["title"],
+                "author": post_data["author"],
+                "url": post_data["url"],
+                "created_utc": datetime.fromisoformat(post_data["created_utc"]),
+                "upvotes": post_data["upvotes"],
+                "num_comments": post_data["num_comments"],
+                "selftext": post_data["selftext"],
+                "sentiment_score": result["post_score"],
+                "ticker_symbol": post_ticker_symbol,
+            }
+            post_subreddit, post_created = post_row["subreddit"], post_row["created_utc"]
+            if found_tickers:
+                count_score(entry["post_key"], result["post_computed"], result["post_score"])
+                mention_sources.append((post_row, "post", found_tickers, post_subreddit, post_created))
+            new_posts.append(post_row)
+            added_count += 1
+
+        for c_data, key, (comment_tickers, score, was_computed) in zip(entry["new_comments"], entry["comment_keys"], result["comments"]):
+            # Prioritize ticker in comment, else inherit from post.
+            comment_ticker_symbol = None
+            comment_region = post_region # Default to post's region
+            if comment_tickers:
+                comment_ticker_symbol, comment_region = comment_tickers[0]
+            elif post_ticker_symbol:
+                # Inherit ticker and region from post if comment has no ticker
+                comment_ticker_symbol = post_ticker_symbol
+
+            comment_created = datetime.fromisoformat(c_data["created_utc"]) if c_data.get("created_utc") else None
+            comment_row = {
+                "id": c_data["id"],
+                "post_id": post_id,
+                "parent_id": c_data.get("parent_id"),
+                "author": c_data["author"],
+                "body": c_data["body"],
+                "upvotes": c_data["upvotes"],
+                "sentiment_score": score,
+                "ticker_symbol": comment_ticker_symbol,
+                "region": comment_region,
+                "created_utc": comment_created,
+            }
+            if comment_ticker_symbol:
+                count_score(key, was_computed, score)
+                # Every ticker in the comment is a mention; an inherited ticker is the post's primary one.
+                mention_tickers = comment_tickers or [(comment_ticker_symbol, comment_region)]
+                mention_sources.append((comment_row, "comment", mention_tickers, post_subreddit, comment_created or post_created))
+            new_comments.append(comment_row)
+
+    (cache or sentiment_cache).record(hits, persistent_hits, computed)
+
+    # One narrow mention row per (source, ticker); the rollup is fed from the same rows
+    # and updated with one upsert per key.
+    new_mentions = []
+    rollup_deltas = {}
+    for row, source_type, tickers, subreddit, created in mention_sources:
+        for ticker, region in tickers:
+            mention = {
+                "source_id": row["id"],
+                "source_type": source_type,
+                "ticker": ticker,
+                "region": region,
+                "subreddit": subreddit,
+                "created_utc": created,
+                "sentiment": row["sentiment_score"],
+                "upvotes": row["upvotes"],
+            }
+            new_mentions.append(mention)
+            add_mention(rollup_deltas, ticker, region, subreddit, created, mention["sentiment"])
+
+    return {
+        "new_posts": new_posts,
+        "new_comments": new_comments,
+        "new_mentions": new_mentions,
+        "post_updates": plan["post_updates"],
+        "comment_updates": plan["comment_updates"],
+        "rollup_deltas": rollup_deltas,
+        "added_count": added_count,
+        "updated_count": updated_count,
+    }
+
+def _build_rows(session, posts, update_existing: bool = True, cache: SentimentCache | None = None):
+    """Diffs, analyzes (in this process) and assembles one batch of posts."""
+    plan = _diff_chunk(session, posts, update_existing, cache)
+    results, _ = analyze_records(plan["records"])
+    return _assemble_rows(plan, results, cache)
+
+def _write_rows(session, batch):
+    """Applies a diffed batch with executemany statements, including its rollup deltas."""
+    new_posts = batch.get("new_posts")
+    new_comments = batch.get("new_comments")
+    post_updates = batch.get("post_updates")
+    comment_updates = batch.get("comment_updates")
+    new_mentions = batch.get("new_mentions")
+    if new_posts:
+        session.execute(RedditPost.__table__.insert(), new_posts)
+    # Plain inserts: the rollup deltas assume every new row is written, so a comment or mention
+    # stored after the prefetch must fail the batch (IntegrityError), which is then re-diffed.
+    if new_comments:
+        session.execute(RedditComment.__table__.insert(), new_comments)
+    if new_mentions:
+        session.execute(Mention.__table__.insert(), new_mentions)
+    if post_updates:
+        session.execute(
+            update(RedditPost.__table__)
+            .where(RedditPost.__table__.c.id == bindparam("b_id"))
+            .values(upvotes=bindparam("b_upvotes"), num_comments=bindparam("b_num_comments")),
+            post_updates,
+        )
+    if comment_updates:
+        session.execute(
+            update(RedditComment.__table__)
+            .where(RedditComment.__table__.c.id == bindparam("b_id"))
+            .values(upvotes=bindparam("b_upvotes")),
+            comment_updates,
+        )
+    # Keep the upvotes on mention rows in sync with their source.
+    for source_type, updates in (("post", post_updates), ("comment", comment_updates)):
+        if updates:
+            session.execute(
+                update(Mention.__table__)
+                .where(Mention.__table__.c.source_id == bindparam("b_id"), Mention.__table__.c.source_type == source_type)
+                .values(upvotes=bindparam("b_upvotes"), updated_generation=next_data_generation()),
+                [{"b_id": row["b_id"], "b_upvotes": row["b_upvotes"]} for row in updates],
+            )
+    apply_rollup_deltas(session, batch.get("rollup_deltas"))
+
+def _write_chunk(session, posts, batch=None, update_existing: bool = True,
+                 cache: SentimentCache | None = None) -> tuple[int, int, int]:
+    """
+    Writes one chunk of posts inside a savepoint, using batch if it was already built.
+    If the chunk violates a constraint (e.g. a duplicate URL, or a comment another writer
+    stored after the diff), it is rebuilt and retried post by post, so rows stored in the
+    meantime are diffed again and only the offending posts are skipped.
+    Returns (added_count, updated_count, skipped_count).
+    """
+    try:
+        with session.begin_nested():
+            batch = batch or _build_rows(session, posts, update_existing, cache)
+            _write_rows(session, batch)
+        return batch["added_count"], batch["updated_count"], 0
     except IntegrityError:
-        session.rollback()
-        print("IntegrityError: Skipping duplicate entries.")
+        pass
+
+    added_count = updated_count = skipped_count = 0
+    for post_data in posts:
+        try:
+            with session.begin_nested():
+                batch = _build_rows(session, [post_data], update_existing, cache)
+                _write_rows(session, batch)
+            added_count += batch["added_count"]
+            updated_count += batch["updated_count"]
+        except IntegrityError:
+            skipped_count += 1
+            print(f"IntegrityError: Skipping duplicate post {post_data['id']}.")
+    return added_count, updated_count, skipped_count
+
+def get_recent_post_ids(since: datetime) -> list[str]:
+    """Returns ids of stored posts created after since, newest first."""
+    session = SessionLocal()
+    try:
+        rows = session.execute(
+            select(RedditPost.id).where(RedditPost.created_utc >= since).order_by(RedditPost.created_utc.desc())
+        )
+        return [row.id for row in rows]
+    finally:
+        session.close()
+
+def update_post_metrics(updates: list[dict]):
+    """Bulk-updates upvotes and num_comments from a list of {"id", "upvotes", "num_comments"} dicts."""
+    if not updates:
+        return
+    session = SessionLocal()
+    try:
+        with metrics.db_seconds.time(operation="write"):
+            _write_rows(session, {"post_updates": [
+                {"b_id": row["id"], "b_upvotes": row["upvotes"], "b_num_comments": row["num_comments"]} for row in updates
+            ]})
+        with metrics.db_seconds.time(operation="commit"):
+            bump_data_generation(session) # Invalidates cached responses and the analytics store
+            session.commit()
+        print(f"Refreshed metrics for {len(updates)} posts.")
+    finally:
+        session.close()
+
+def _ignore_interrupts():
+    """Worker initializer: Ctrl+C is handled by the writer, which cancels the pool itself."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _pool_context():
+    """
+    The pool is created while fetch threads may already be running; forking then can copy a
+    lock some thread holds, so workers start from a fresh process instead.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _chunk_ids(chunk) -> set:
+    """Post and comment ids of a chunk, used to tell when two in-flight chunks overlap."""
+    ids = {post_data["id"] for post_data in chunk}
+    ids.update(c_data["id"] for post_data in chunk for c_data in post_data.get("comments", []))
+    return ids
+
+def _print_stage_throughput(stages: dict, workers: int, elapsed: float):
+    print(f"Ingest throughput over {elapsed:.2f}s:")
+    for name, (unit, items, seconds) in stages.items():
+        rate = items / seconds if seconds else 0.0
+        line = f"  {name:<8} {items} {unit} in {seconds:.2f}s ({rate:.0f}/s"
+        if name == "analyze" and workers > 1:
+            line += f" per worker, {workers} workers"
+        print(line + ")")
+
+def insert_posts(posts, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int | None = None, session_factory=None,
+                 update_existing: bool = True, cache: SentimentCache | None = None):
+    """
+    Insert new Reddit posts and comments, skipping duplicates.
+    Accepts any iterable (including the iter_posts generator) and commits every chunk_size posts,
+    so a late failure never throws away earlier chunks.
+    Each chunk goes through three stages: diff (read what is already stored), analyze (ticker
+    extraction and sentiment scoring of new texts) and write. With workers > 1, analysis runs
+    in a process pool while this thread keeps diffing and writing; chunks are still written
+    in arrival order by this single writer.
+    session_factory selects another database (e.g. a fresh one for archive replays).
+    With update_existing=False, stored posts and comments keep their metrics and only missing
+    rows are inserted (archive replays must not overwrite fresher upvotes with archived ones).
+    cache replaces the shared sentiment cache, e.g. with one stored in the replay database.
+    """
+    cache = cache or sentiment_cache
+    session = (session_factory or SessionLocal)()
+    added_count = 0
+    updated_count = 0
+    skipped_count = 0
+    posts = iter(posts)
+    workers = workers or 1
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=_pool_context(), initializer=_ignore_interrupts
+    ) if workers > 1 else None
+    in_flight = deque() # (chunk, ids, plan, analysis future or result), oldest first
+    # Stage name -> [unit, items, busy seconds]; analysis time is summed over workers.
+    stages = {"diff": ["posts", 0, 0.0], "analyze": ["texts", 0, 0.0], "write": ["rows", 0, 0.0]}
+    started = time.perf_counter()
+
+    def write_oldest():
+        nonlocal added_count, updated_count, skipped_count
+        chunk, _, plan, pending = in_flight.popleft()
+        results, timings = pending.result() if executor else pending
+        stages["analyze"][1] += sum((record["post_text"] is not None) + len(record["comments"]) for record in plan["records"])
+        stages["analyze"][2] += timings["extract"] + timings["score"]
+        metrics.analysis_seconds.observe(timings["extract"], stage="extract")
+        metrics.analysis_texts.inc(timings["extracted"], stage="extract")
+        metrics.analysis_seconds.observe(timings["score"], stage="score")
+        metrics.analysis_texts.inc(timings["scored"], stage="score")
+
+        write_started = time.perf_counter()
+        with metrics.db_seconds.time(operation="write"):
+            batch = _assemble_rows(plan, results, cache)
+            added, updated, skipped = _write_chunk(session, chunk, batch, update_existing, cache)
+        with metrics.db_seconds.time(operation="commit"):
+            bump_data_generation(session)
+            session.commit()
+        with metrics.db_seconds.time(operation="cache_flush"):
+            cache.flush()
+        stages["write"][1] += len(batch["new_posts"]) + len(batch["new_comments"]) + len(batch["new_mentions"])
+        stages["write"][2] += time.perf_counter() - write_started
+        for table in ("posts", "comments", "mentions"):
+            metrics.ingest_rows_written.inc(len(batch[f"new_{table}"]), table=table)
+        metrics.ingest_posts.inc(added, result="added")
+        metrics.ingest_posts.inc(updated, result="updated")
+        metrics.ingest_posts.inc(skipped, result="skipped")
+        added_count += added
+        updated_count += updated
+        skipped_count += skipped
+
+    try:
+        while True:
+            chunk = list(islice(posts, chunk_size))
+            if not chunk:
+                break
+            # A chunk is diffed against what is stored, so a post or comment that is also in an
+            # unwritten chunk would be treated as new twice. Write those earlier chunks first.
+            ids = _chunk_ids(chunk)
+            while in_flight and any(ids & entry[1] for entry in in_flight):
+                write_oldest()
+            diff_started = time.perf_counter()
+            with metrics.db_seconds.time(operation="diff"):
+                plan = _diff_chunk(session, chunk, update_existing, cache)
+            stages["diff"][1] += len(chunk)
+            stages["diff"][2] += time.perf_counter() - diff_started
+
+            if executor:
+                pending = executor.submit(analyze_records, plan["records"])
+            else:
+                pending = analyze_records(plan["records"])
+            in_flight.append((chunk, ids, plan, pending))
+            # Keep every worker busy without buffering the whole input.
+            if len(in_flight) > 2 * workers:
+                write_oldest()
+        while in_flight:
+            write_oldest()
     finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
         session.close()
+        print(f"Inserted {added_count} new posts and updated {updated_count} existing posts.")
+        if skipped_count:
+            print(f"Skipped {skipped_count} posts because of duplicate entries.")
+        print(f"Sentiment cache: {cache.stats()}")
+        _print_stage_throughput(stages, workers, time.perf_counter() - started)
@@ -0,0 +1,54 @@
+"""
+fetch_state.py
+--------------
+Persists per-subreddit high-water marks so fetches only pull posts newer than the last run.
+"""
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from ..database import SessionLocal
+from ..models import FetchWatermark
+
+def load_watermarks() -> dict:
+    """Returns {(subreddit, fetch_type): {"created_utc", "post_id"}} for every stored watermark."""
+    session = SessionLocal()
+    try:
+        rows = session.execute(select(FetchWatermark))
+        return {
+            (mark.subreddit, mark.fetch_type): {"created_utc": mark.newest_created_utc, "post_id": mark.newest_post_id}
+            for mark in rows.scalars()
+        }
+    finally:
+        session.close()
+
+def save_watermarks(watermarks: dict):
+    """Upserts watermarks. Call this only after the fetched posts have been written."""
+    if not watermarks:
+        return
+    rows = [
+        {
+            "subreddit": subreddit,
+            "fetch_type": fetch_type,
+            "newest_created_utc": mark["created_utc"],
+            "newest_post_id": mark["post_id"],
+            "updated_at": datetime.utcnow(),
+        }
+        for (subreddit, fetch_type), mark in watermarks.items()
+    ]
+    stmt = sqlite_insert(FetchWatermark.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["subreddit", "fetch_type"],
+        set_={
+            "newest_created_utc": stmt.excluded.newest_created_utc,
+            "newest_post_id": stmt.excluded.newest_post_id,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        # Never move a watermark backwards.
+        where=FetchWatermark.__table__.c.newest_created_utc <= stmt.excluded.newest_created_utc,
+    )
+    session = SessionLocal()
+    try:
+        session.execute(stmt, rows)
+        session.commit()
+    finally:
+        session.close()
@@ -2,69 +2,130 @@
 financial_data_updater.py
 -------------------------
 Fetches and updates financial data for all known tickers in the database.
+Finnhub calls run on a small worker pool limited by finnhub_client's rate limiter,
+while all database writes happen on the calling thread and are committed incrementally.
 """
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import time
+from sqlalchemy import case, func, or_, select
+from .. import metrics
 from ..database import SessionLocal
-from ..models import RedditComment, TickerData
+from ..models import Mention, TickerData
 from . import finnhub_client
+from .data_generation import bump_data_generation
 
-def update_all_ticker_data():
+# Profiles (name, industry) rarely change; quotes go stale within minutes.
+PROFILE_TTL = timedelta(days=7)
+QUOTE_TTL = timedelta(minutes=15)
+
+# Mentions within this window decide which tickers are refreshed first.
+RECENT_MENTION_WINDOW = timedelta(hours=24)
+
+# Number of tickers written per commit.
+COMMIT_EVERY = 10
+
+def _plan_updates(session, now, max_tickers=None):
+    """
+    Returns [(ticker, existing_data, needs_profile, needs_quote)] for tickers whose data is
+    missing or stale, hottest first. A single query counts post and comment mentions from
+    the mentions table, joins ticker_data and filters on the TTLs.
+    """
+    recent_cutoff = now - RECENT_MENTION_WINDOW
+    mentions = select(Mention.ticker, Mention.created_utc).where(Mention.region == 'US').subquery()
+
+    recent_mentions = func.sum(case((mentions.c.created_utc >= recent_cutoff, 1), else_=0))
+    profile_stale = or_(TickerData.profile_updated == None, TickerData.profile_updated < now - PROFILE_TTL)
+    quote_stale = or_(TickerData.quote_updated == None, TickerData.quote_updated < now - QUOTE_TTL)
+    query = (
+        select(mentions.c.ticker, TickerData.profile_updated, TickerData.quote_updated)
+        .join(TickerData, mentions.c.ticker == TickerData.ticker, isouter=True)
+        .where(or_(TickerData.ticker == None, profile_stale, quote_stale))
+        .group_by(mentions.c.ticker, TickerData.profile_updated, TickerData.quote_updated)
+        .order_by(recent_mentions.desc(), func.count().desc())
+    )
+    if max_tickers:
+        query = query.limit(max_tickers)
+    stale = session.execute(query).all()
+    print(f"Found {len(stale)} US tickers with missing or stale financial data.")
+
+    # Load the existing rows to update with one IN query.
+    tickers = [row.ticker for row in stale]
+    existing = {data.ticker: data for data in session.query(TickerData).filter(TickerData.ticker.in_(tickers))} if tickers else {}
+
+    plan = []
+    for row in stale:
+        needs_profile = row.profile_updated is None or row.profile_updated < now - PROFILE_TTL
+        needs_quote = row.quote_updated is None or row.quote_updated < now - QUOTE_TTL
+        plan.append((row.ticker, existing.get(row.ticker), needs_profile, needs_quote))
+    return plan
+
+def _fetch_ticker(ticker, needs_profile, needs_quote, client):
+    """Runs on a worker thread: performs only the Finnhub calls whose data is stale."""
+    profile = finnhub_client.get_company_profile(ticker, client=client) if needs_profile else None
+    quote = finnhub_client.get_quote(ticker, client=client) if needs_quote else None
+    return profile, quote
+
+def _apply_update(session, ticker, existing_data, profile, quote, now):
+    """Writes fetched profile and/or quote data to the ticker's row."""
+    data = existing_data
+    if data is None:
+        data = TickerData(ticker=ticker)
+        session.add(data)
+    if profile is not None:
+        data.name = profile.get('name')
+        data.profile_updated = now
+    if quote is not None:
+        data.current_price = quote.get('c')
+        data.price_change = quote.get('d')
+        data.price_percent_change = quote.get('dp')
+        data.day_high = quote.get('h')
+        data.day_low = quote.get('l')
+        data.quote_updated = now
+    data.last_updated = now
+
+def update_all_ticker_data(max_workers: int = 4, client=None, max_tickers: int | None = None):
     """
     Finds all unique tickers from comments/posts and updates their financial data.
+    client can be any object with finnhub.Client's company_profile2/quote methods (e.g. a stub).
+    max_tickers caps one run to the most-mentioned stale tickers.
     """
     session = SessionLocal()
     updated_count = 0
-    skipped_count = 0
-    # Define how old data can be before we refresh it (e.g., 4 hours)
-    staleness_threshold = datetime.utcnow() - timedelta(hours=4)
+    failed_count = 0
+    now = datetime.utcnow()
 
     try:
-        # Get all unique US tickers mentioned in our database
-        tickers_in_db = session.query(RedditComment.ticker_symbol).filter(
-            RedditComment.ticker_symbol != None,
-            RedditComment.region == 'US'
-        ).distinct().all()
-        us_tickers = {row[0] for row in tickers_in_db}
-
-        print(f"Found {len(us_tickers)} unique US tickers. Checking for stale financial data...")
-
-        if not us_tickers:
-            print("No US tickers found to update.")
+        with metrics.db_seconds.time(operation="plan"):
+            plan = _plan_updates(session, now, max_tickers)
+        if not plan:
+            print("No US tickers need updating.")
             return
 
-        for ticker in us_tickers:
-            try:
-                existing_data = session.get(TickerData, ticker)
-                # If data exists and is fresh, skip the update for this ticker
-                if existing_data and existing_data.last_updated > staleness_threshold:
-                    skipped_count += 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_fetch_ticker, ticker, needs_profile, needs_quote, client): (ticker, existing_data)
+                for ticker, existing_data, needs_profile, needs_quote in plan
+            }
+            for future in as_completed(futures):
+                ticker, existing_data = futures[future]
+                try:
+                    profile, quote = future.result()
+                except Exception as e:
+                    failed_count += 1
+                    print(f"  - FAILED to update data for {ticker}: {e}")
                     continue
 
-                print(f"  - Updating data for {ticker}...")
-                profile = finnhub_client.get_company_profile(ticker)
-                quote = finnhub_client.get_quote(ticker)
-                                
-                if existing_data:
-                    existing_data.name = profile.get('name')
-                    existing_data.current_price = quote.get('c')
-                    existing_data.price_change = quote.get('d')
-                    existing_data.price_percent_change = quote.get('dp')
-                    existing_data.day_high = quote.get('h')
-                    existing_data.day_low = quote.get('l')
-                else:
-                    new_data = TickerData(
-                        ticker=ticker, name=profile.get('name'), current_price=quote.get('c'),
-                        price_change=quote.get('d'), price_percent_change=quote.get('dp'),
-                        day_high=quote.get('h'), day_low=quote.get('l'),
-                    )
-                    session.add(new_data)
+                print(f"  - Updated data for {ticker}.")
+                _apply_update(session, ticker, existing_data, profile, quote, now)
                 updated_count += 1
-                time.sleep(1) # Respect API rate limits
-            except Exception as e:
-                print(f"  - FAILED to update data for {ticker}: {e}")
+                if updated_count % COMMIT_EVERY == 0:
+                    with metrics.db_seconds.time(operation="commit"):
+                        bump_data_generation(session)
+                        session.commit()
 
-        session.commit()
-        print(f"\nSuccessfully updated {updated_count} tickers and skipped {skipped_count} fresh ones.")
+        with metrics.db_seconds.time(operation="commit"):
+            bump_data_generation(session)
+            session.commit()
+        print(f"\nSuccessfully updated {updated_count} tickers and failed {failed_count}.")
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
@@ -2,34 +2,57 @@
 finnhub_client.py
 -----------------
 Handles all interactions with the Finnhub API.
+Every call draws from a shared token bucket sized to the API's calls-per-minute quota,
+and its latency and rate-limit wait are recorded per endpoint.
 """
 from datetime import datetime, timedelta
+import os
 import time
 
-import finnhub
-from ..config import FINNHUB_API_KEY
+from .. import metrics
+from ..config import require_finnhub_api_key
+from .rate_limit import RequestBudget
+
+# The free tier allows 60 calls per minute.
+FINNHUB_CALLS_PER_MINUTE = int(os.getenv("FINNHUB_CALLS_PER_MINUTE", "60"))
+
+rate_limiter = RequestBudget(FINNHUB_CALLS_PER_MINUTE)
 
 _finnhub_client = None
 
 def get_finnhub_client():
-    """Initializes and returns a singleton Finnhub client."""
+    """Initializes and returns a singleton Finnhub client. The finnhub package is imported on first use."""
     global _finnhub_client
     if _finnhub_client is None:
-        _finnhub_client = finnhub.Client(api_key=FINNHUB_API_KEY)
+        import finnhub
+        _finnhub_client = finnhub.Client(api_key=require_finnhub_api_key())
     return _finnhub_client
 
-def get_company_profile(ticker: str) -> dict:
+def _call(endpoint: str, method, **params):
+    """Waits for the rate limiter, then calls the client method and records its latency."""
+    with metrics.finnhub_rate_limit_wait_seconds.time(endpoint=endpoint):
+        rate_limiter.acquire()
+    started = time.perf_counter()
+    status = "error"
+    try:
+        result = method(**params)
+        status = "ok"
+        return result
+    finally:
+        metrics.finnhub_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint, status=status)
+
+def get_company_profile(ticker: str, client=None) -> dict:
     """Fetches a company profile for a given ticker."""
-    client = get_finnhub_client()
+    client = client or get_finnhub_client()
     # Using profile2 for more detailed data
-    return client.company_profile2(symbol=ticker)
+    return _call("company_profile2", client.company_profile2, symbol=ticker)
 
-def get_quote(ticker: str) -> dict:
+def get_quote(ticker: str, client=None) -> dict:
     """Fetches the latest quote data for a given ticker."""
-    client = get_finnhub_client()
-    return client.quote(symbol=ticker)
+    client = client or get_finnhub_client()
+    return _call("quote", client.quote, symbol=ticker)
 
-def get_basic_financials(ticker: str) -> dict:
+def get_basic_financials(ticker: str, client=None) -> dict:
     """Fetches basic financial metrics like P/E ratio."""
-    client = get_finnhub_client()
-    return client.company_basic_financials(symbol=ticker, metric='all')
\ No newline at end of file
+    client = client or get_finnhub_client()
+    return _call("company_basic_financials", client.company_basic_financials, symbol=ticker, metric='all')
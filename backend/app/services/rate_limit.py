@@ -0,0 +1,33 @@
+"""
+rate_limit.py
+-------------
+Token-bucket request budget shared by the API clients' worker threads.
+"""
+import threading
+import time
+
+class RequestBudget:
+    """
+    Thread-safe token bucket shared by all workers of one API client, so concurrent
+    requests stay within the API's per-minute quota.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, burst: int | None = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst or max(1, requests_per_minute // 6)
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until one request may be made."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
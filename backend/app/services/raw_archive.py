@@ -0,0 +1,91 @@
+"""
+raw_archive.py
+--------------
+Append-only archive of the raw post payloads produced by the Reddit fetcher (the dicts
+that go into insert_posts, comments included). Payloads are stored as gzip-compressed
+NDJSON segment files, so stored data can be reprocessed after changing TICKER_MAP or the
+sentiment logic without fetching from Reddit again.
+"""
+from datetime import datetime
+import glob
+import gzip
+import os
+import zlib
+
+import orjson
+
+from ..database import DB_DIRECTORY
+
+ARCHIVE_DIRECTORY = os.path.join(os.path.dirname(DB_DIRECTORY), "archive")
+
+# A new segment file is started after this many posts.
+SEGMENT_MAX_POSTS = 10_000
+
+class ArchiveWriter:
+    """
+    Writes posts to segment files named posts-<UTC start time>-<sequence>.ndjson.gz.
+    Every writer starts new segments and never reopens old ones, so a crash can at worst
+    truncate the segment that was being written.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIRECTORY, segment_max_posts: int = SEGMENT_MAX_POSTS):
+        self.directory = directory
+        self.segment_max_posts = segment_max_posts
+        self._started = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        self._sequence = 0
+        self._file = None
+        self._segment_posts = 0
+        self.posts_written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"posts-{self._started}-{self._sequence:04d}.ndjson.gz")
+        self._sequence += 1
+        self._segment_posts = 0
+        self._file = gzip.open(path, "xb", compresslevel=6)
+
+    def write(self, post: dict):
+        if self._file is None or self._segment_posts >= self.segment_max_posts:
+            self.close()
+            self._open_segment()
+        self._file.write(orjson.dumps(post) + b"\n")
+        self._segment_posts += 1
+        self.posts_written += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def archive_posts(posts, writer: ArchiveWriter):
+    """Passes posts through unchanged while appending each one to the archive."""
+    for post in posts:
+        writer.write(post)
+        yield post
+
+def list_segments(directory: str = ARCHIVE_DIRECTORY) -> list[str]:
+    """Returns the archive's segment files, oldest first."""
+    return sorted(glob.glob(os.path.join(directory, "posts-*.ndjson.gz")))
+
+def iter_archive(directory: str = ARCHIVE_DIRECTORY, segments: list[str] | None = None):
+    """
+    Yields archived posts in the order they were fetched.
+    A truncated final line or segment (e.g. after a crash) ends that segment with a warning.
+    """
+    for path in segments if segments is not None else list_segments(directory):
+        try:
+            with gzip.open(path, "rb") as segment:
+                for line in segment:
+                    try:
+                        yield orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        print(f"Skipping truncated record in {os.path.basename(path)}.")
+                        break
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            print(f"Segment {os.path.basename(path)} is truncated, stopping there: {e}")
@@ -13,84 +13,299 @@ Intended functionality:
 
 # Use 'python -m app.services.reddit_fetcher' for isolated test
 
-import praw
 import csv
 import os
-from datetime import datetime
-from app.config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
-from ..services.db_writer import insert_posts
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.config import require_reddit_credentials
+from .. import metrics
+from ..services.db_writer import get_recent_post_ids, insert_posts, update_post_metrics
 from ..analysis.tickers import get_ticker_search_query
-from ..database import Base, engine
+from .rate_limit import RequestBudget
+from .raw_archive import ArchiveWriter, archive_posts
+from ..database import init_db
 
-def get_reddit_client(): # Initialize and return a reddit client.
+def get_reddit_client(): # Initialize and return a reddit client. PRAW is imported on first use.
+    import praw
+    client_id, client_secret, user_agent = require_reddit_credentials()
     reddit = praw.Reddit(
-        client_id=REDDIT_CLIENT_ID,
-        client_secret=REDDIT_CLIENT_SECRET,
-        user_agent=REDDIT_USER_AGENT
+        client_id=client_id,
+        client_secret=client_secret,
+        user_agent=user_agent
     )
     return reddit
 
-def _fetch_comment_tree(comment_forest, parent_id=None, limit_per_level=5):
-    """Recursively fetch comments and their replies."""
+# Default limits for comment trees: breadth[i] is how many replies are kept at depth i
+# (the last value repeats for deeper levels).
+COMMENT_MAX_DEPTH = 5
+COMMENT_MAX_NODES = 200
+COMMENT_BREADTH = (5, 2)
+
+def _fetch_comment_tree(comment_forest, max_depth=COMMENT_MAX_DEPTH, max_nodes=COMMENT_MAX_NODES,
+                        breadth=COMMENT_BREADTH):
+    """
+    Fetches a submission's comments breadth-first, bounded by depth, total node count
+    and per-level breadth. "Load more comments" stubs are removed once for the whole tree.
+    """
     comments_data = []
-    comment_forest.replace_more(limit=0) # Expand "load more comments"
-    
-    count = 0
-    for comment in comment_forest:
-        if count >= limit_per_level:
-            break
+    comment_forest.replace_more(limit=0) # Drop "load more comments" stubs without extra requests
+
+    def level_breadth(depth):
+        return breadth[min(depth, len(breadth) - 1)]
+
+    queue = deque((comment, None, 0) for comment in list(comment_forest)[:level_breadth(0)])
+    while queue and len(comments_data) < max_nodes:
+        comment, parent_id, depth = queue.popleft()
         comments_data.append({
             "id": comment.id,
             "author": str(comment.author),
             "body": comment.body,
             "upvotes": comment.score,
+            "created_utc": datetime.utcfromtimestamp(comment.created_utc).isoformat(),
             "parent_id": parent_id
         })
-        # Recursively fetch replies to this comment
-        comments_data.extend(_fetch_comment_tree(comment.replies, parent_id=comment.id, limit_per_level=2))
-        count += 1
+        if depth + 1 < max_depth:
+            for reply in list(comment.replies)[:level_breadth(depth + 1)]:
+                queue.append((reply, comment.id, depth + 1))
     return comments_data
 
-def fetch_posts(subreddit_config, limit=10, include_comments=True): # Fetches posts based on subreddit configuration.
+def _timed_comment_tree(comment_forest, subreddit, comment_limits):
+    """_fetch_comment_tree with its latency and comment count recorded per subreddit."""
+    with metrics.reddit_comment_tree_seconds.time(subreddit=subreddit):
+        comments_data = _fetch_comment_tree(comment_forest, **comment_limits)
+    metrics.reddit_comments_fetched.inc(len(comments_data), subreddit=subreddit)
+    return comments_data
+
+def _post_to_dict(post, sub_name, region):
+    return {
+        "id": post.id,
+        "subreddit": sub_name,
+        "region": region,
+        "title": post.title,
+        "author": str(post.author),
+        "url": post.url,
+        "created_utc": datetime.utcfromtimestamp(post.created_utc).isoformat(),
+        "upvotes": post.score,
+        "num_comments": post.num_comments,
+        "selftext": post.selftext,
+    }
+
+def _iter_subreddit(reddit, region, config, limit, search_query, budget=None, watermarks=None):
+    """
+    Yields the raw submissions for one subreddit config entry, newest first.
+    A "limit" in the config entry overrides limit for this subreddit.
+    If watermarks holds a mark for the subreddit, the listing is paged past limit until it
+    reaches that mark, so no posts are skipped between runs. The newest post seen is recorded
+    in watermarks only once the old mark was reached or the listing ran out.
+    """
+    sub_name = config["name"]
+    fetch_type = config["type"]
+    limit = config.get("limit", limit)
+    subreddit = reddit.subreddit(sub_name)
+    key = (sub_name, fetch_type)
+    mark = watermarks.get(key) if watermarks is not None else None
+    newest = None
+    if mark:
+        limit = None # PRAW pages as deep as Reddit allows (about 1000 posts)
+
+    post_iterator = []
+    if fetch_type == "firehose":
+        print(f"Fetching all new posts from r/{sub_name} (Region: {region})...")
+        post_iterator = subreddit.new(limit=limit)
+    elif fetch_type == "search":
+        print(f"Searching for ticker mentions in r/{sub_name} (Region: {region})...")
+        post_iterator = subreddit.search(search_query, sort="new", limit=limit)
+
+    # Only the time spent inside the listing (i.e. waiting on Reddit) is recorded,
+    # not the budget waits or the consumer's work between posts.
+    posts = iter(post_iterator)
+    index = 0
+    listing_seconds = 0.0
+    reached_mark = False
+    try:
+        while True:
+            # Listings are paged 100 items per request.
+            if budget and index % 100 == 0:
+                budget.acquire()
+            started = time.perf_counter()
+            post = next(posts, None)
+            listing_seconds += time.perf_counter() - started
+            if post is None:
+                break
+            created = datetime.utcfromtimestamp(post.created_utc)
+            if mark and (created < mark["created_utc"] or post.id == mark["post_id"]):
+                print(f"Reached watermark for r/{sub_name} ({fetch_type}) after {index} new posts.")
+                reached_mark = True
+                break
+            if newest is None or created > newest["created_utc"]:
+                newest = {"created_utc": created, "post_id": post.id}
+            yield post
+            index += 1
+    finally:
+        metrics.reddit_listing_seconds.observe(listing_seconds, subreddit=sub_name, fetch_type=fetch_type)
+        metrics.reddit_posts_fetched.inc(index, subreddit=sub_name)
+
+    # Only reached when the listing ended or hit the mark, not when the consumer stopped early.
+    if mark and not reached_mark:
+        print(f"Warning: r/{sub_name} ({fetch_type}) listing ended after {index} posts without reaching "
+              f"the watermark; older posts are beyond Reddit's listing depth and were missed.")
+    if watermarks is not None and newest:
+        watermarks[key] = newest
+
+def iter_posts(subreddit_config, limit=10, include_comments=True, comment_limits=None, watermarks=None):
+    """
+    Generator version of fetch_posts: yields each post (with its comment tree)
+    as soon as it has been fetched, so memory stays flat regardless of limit.
+    comment_limits optionally overrides max_depth, max_nodes and breadth for comment trees.
+    watermarks (see fetch_state.load_watermarks) makes the fetch incremental; it is advanced
+    in place and should be saved once the posts have been written.
+    """
+    comment_limits = comment_limits or {}
     reddit = get_reddit_client()
-    results = []
     search_query = get_ticker_search_query()
 
     for region, configs in subreddit_config.items():
         for config in configs:
-            sub_name = config["name"]
-            fetch_type = config["type"]
-            subreddit = reddit.subreddit(sub_name)
-            
-            post_iterator = []
-            if fetch_type == "firehose":
-                print(f"Fetching all new posts from r/{sub_name} (Region: {region})...")
-                post_iterator = subreddit.new(limit=limit)
-            elif fetch_type == "search":
-                print(f"Searching for ticker mentions in r/{sub_name} (Region: {region})...")
-                post_iterator = subreddit.search(search_query, sort="new", limit=limit)
-
-            for post in post_iterator:
-                post_data = {
-                    "id": post.id,
-                    "subreddit": sub_name,
-                    "region": region,
-                    "title": post.title,
-                    "author": str(post.author),
-                    "url": post.url,
-                    "created_utc": datetime.utcfromtimestamp(post.created_utc).isoformat(),
-                    "upvotes": post.score,
-                    "num_comments": post.num_comments,
-                    "selftext": post.selftext,
-                }
+            for post in _iter_subreddit(reddit, region, config, limit, search_query, watermarks=watermarks):
+                post_data = _post_to_dict(post, config["name"], region)
     
                 # Optionally fetch top-level comments
                 if include_comments:
-                    post_data["comments"] = _fetch_comment_tree(post.comments, limit_per_level=5)
-    
-                results.append(post_data)
+                    post_data["comments"] = _timed_comment_tree(post.comments, config["name"], comment_limits)
     
-    return results
+                yield post_data
+
+# Marker a listing thread puts on the results queue, with its post count, when its listing is finished.
+_LISTING_DONE = object()
+# Marker put instead of a post whose comment tree could not be fetched.
+_POST_FAILED = object()
+
+def iter_posts_concurrent(subreddit_config, limit=10, include_comments=True, max_workers=4,
+                          budget: RequestBudget | None = None, reddit_factory=get_reddit_client,
+                          comment_limits=None, watermarks=None, max_pending=None, failures=None):
+    """
+    Concurrent version of iter_posts. Subreddit listings and comment trees are fetched
+    by thread pools, and every request draws from one shared RequestBudget.
+    Posts are yielded in completion order.
+    Listings are streamed, and at most max_pending (default 2 * max_workers) posts are being
+    fetched or waiting for the consumer at any time, so memory stays flat like iter_posts.
+    reddit_factory builds one client per worker thread (PRAW clients are not thread-safe)
+    and can be replaced by a stub for testing.
+    By default the first error aborts the whole fetch. With a failures dict, an error only ends
+    its own subreddit: it is recorded as failures[(subreddit, fetch_type)] = exception, that
+    subreddit's watermark is not advanced and the other subreddits are fetched as usual.
+    """
+    budget = budget or RequestBudget()
+    comment_limits = comment_limits or {}
+    search_query = get_ticker_search_query()
+    local = threading.local()
+    max_pending = max_pending or 2 * max_workers
+    slots = threading.Semaphore(max_pending) # Released when the consumer takes a post
+    results = queue.Queue() # Bounded in practice by slots, plus one done marker per listing
+    stopped = threading.Event()
+
+    def thread_client():
+        if not hasattr(local, "reddit"):
+            local.reddit = reddit_factory()
+        return local.reddit
+
+    def fetch_comments(post_data, key):
+        try:
+            budget.acquire()
+            submission = thread_client().submission(id=post_data["id"])
+            post_data["comments"] = _timed_comment_tree(submission.comments, post_data["subreddit"], comment_limits)
+            results.put(post_data)
+        except BaseException as e:
+            results.put((_POST_FAILED, key, e))
+
+    def fetch_listing(region, config, comment_executor):
+        key = (config["name"], config["type"])
+        produced = 0
+        try:
+            for post in _iter_subreddit(thread_client(), region, config, limit, search_query, budget, watermarks):
+                # Wait for a free slot, so a slow consumer throttles the listing too.
+                while not slots.acquire(timeout=0.1):
+                    if stopped.is_set():
+                        return
+                post_data = _post_to_dict(post, config["name"], region)
+                produced += 1
+                if include_comments:
+                    comment_executor.submit(fetch_comments, post_data, key)
+                else:
+                    results.put(post_data)
+            results.put((_LISTING_DONE, produced, key, None))
+        except BaseException as e:
+            results.put((_LISTING_DONE, produced, key, e))
+
+    def record_failure(key, error):
+        if failures is None:
+            raise error
+        if key not in failures:
+            print(f"Fetching r/{key[0]} ({key[1]}) failed: {error}")
+            failures[key] = error
+
+    configs = [(region, config) for region, region_configs in subreddit_config.items() for config in region_configs]
+    listing_executor = ThreadPoolExecutor(max_workers=max_workers)
+    comment_executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for region, config in configs:
+            listing_executor.submit(fetch_listing, region, config, comment_executor)
+        active_listings = len(configs)
+        produced = taken = 0
+        # Runs until every listing is done and every post it produced has been taken.
+        while active_listings or taken < produced:
+            item = results.get()
+            if isinstance(item, tuple) and item[0] is _LISTING_DONE:
+                _, count, key, error = item
+                active_listings -= 1
+                produced += count
+                if error is not None:
+                    record_failure(key, error)
+                continue
+            taken += 1
+            slots.release()
+            if isinstance(item, tuple) and item[0] is _POST_FAILED:
+                record_failure(item[1], item[2])
+                continue
+            yield item
+        if watermarks is not None and failures:
+            # A failed subreddit may have advanced its mark past posts that were never delivered.
+            for key in failures:
+                watermarks.pop(key, None)
+    finally:
+        stopped.set()
+        listing_executor.shutdown(wait=True, cancel_futures=True)
+        comment_executor.shutdown(wait=True, cancel_futures=True)
+
+def refresh_recent_posts(max_age_hours=24, reddit=None, budget: RequestBudget | None = None):
+    """
+    Cheap refresh pass: re-reads score and comment count for posts younger than max_age_hours
+    in batches of 100 (one request each) and bulk-updates them, without fetching comment trees.
+    """
+    reddit = reddit or get_reddit_client()
+    post_ids = get_recent_post_ids(datetime.utcnow() - timedelta(hours=max_age_hours))
+    print(f"Refreshing metrics for {len(post_ids)} recent posts...")
+
+    updates = []
+    for i in range(0, len(post_ids), 100):
+        if budget:
+            budget.acquire()
+        fullnames = [f"t3_{post_id}" for post_id in post_ids[i:i + 100]]
+        for post in reddit.info(fullnames=fullnames):
+            updates.append({"id": post.id, "upvotes": post.score, "num_comments": post.num_comments})
+
+    update_post_metrics(updates)
+    return len(updates)
+
+def fetch_posts(subreddit_config, limit=10, include_comments=True, comment_limits=None, archive: ArchiveWriter | None = None): # Fetches posts based on subreddit configuration.
+    posts = iter_posts(subreddit_config, limit=limit, include_comments=include_comments, comment_limits=comment_limits)
+    if archive is not None: # Keep the raw payloads for later replays
+        posts = archive_posts(posts, archive)
+    return list(posts)
 
 
 # -------------------------                 Connect to reddit using your credentials
@@ -98,7 +313,7 @@ def fetch_posts(subreddit_config, limit=10, include_comments=True): # Fetches po
 # -------------------------
 if __name__ == "__main__":
     print("Initializing database...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
 
     # Define subreddit configurations: 'firehose' for all new, 'search' for ticker-specific.
     subreddit_config = {
@@ -113,6 +328,6 @@ if __name__ == "__main__":
     }
 
     print(f"Fetching posts...")
-    posts_to_insert = fetch_posts(subreddit_config, limit=20, include_comments=True)
-    insert_posts(posts_to_insert)
+    # Stream posts into the writer so each chunk is committed as soon as it is fetched.
+    insert_posts(iter_posts(subreddit_config, limit=20, include_comments=True))
     print("\nProcess finished.")
@@ -0,0 +1,144 @@
+"""
+rollups.py
+----------
+Maintains the tables derived from posts and comments: the narrow mentions fact table
+and the sentiment_rollup table, which pre-aggregates mentions so the report can be
+served without scanning reddit_comments.
+"""
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from ..analysis.tickers import extract_tickers
+from ..models import Mention, RedditComment, RedditPost, SentimentRollup
+from .data_generation import MENTIONS_REBUILD_NAME, bump_data_generation
+
+# Rows read and written per step when rebuilding the mentions table.
+_REBUILD_BATCH_SIZE = 1000
+
+# Used as bucket for comments whose post (and so creation time) is unknown.
+UNKNOWN_BUCKET = datetime(1970, 1, 1)
+
+def hour_bucket(created: datetime | None) -> datetime:
+    """Truncates a timestamp to the start of its hour."""
+    if created is None:
+        return UNKNOWN_BUCKET
+    return created.replace(minute=0, second=0, microsecond=0)
+
+def add_mention(deltas: dict, ticker, region, subreddit, created, sentiment):
+    """Accumulates one mention into an in-memory {key: [count, sum, scored]} delta map."""
+    key = (ticker, region, subreddit or "", hour_bucket(created))
+    delta = deltas.setdefault(key, [0, 0.0, 0])
+    delta[0] += 1
+    if sentiment is not None:
+        delta[1] += sentiment
+        delta[2] += 1
+
+def apply_rollup_deltas(session, deltas: dict):
+    """Adds accumulated deltas to the rollup with one executemany upsert."""
+    if not deltas:
+        return
+    rows = [
+        {
+            "ticker": ticker, "region": region, "subreddit": subreddit, "bucket_start": bucket_start,
+            "mention_count": count, "sentiment_sum": total, "sentiment_count": scored,
+        }
+        for (ticker, region, subreddit, bucket_start), (count, total, scored) in deltas.items()
+    ]
+    table = SentimentRollup.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["ticker", "region", "subreddit", "bucket_start"],
+        set_={
+            "mention_count": table.c.mention_count + stmt.excluded.mention_count,
+            "sentiment_sum": table.c.sentiment_sum + stmt.excluded.sentiment_sum,
+            "sentiment_count": table.c.sentiment_count + stmt.excluded.sentiment_count,
+        },
+    )
+    session.execute(stmt, rows)
+
+def rebuild_mentions(session):
+    """
+    Recomputes the mentions table from stored posts and comments (used to backfill databases
+    from before it existed). Tickers are re-extracted from the text, so multi-ticker posts and
+    comments get one row per ticker; the stored sentiment score is reused.
+    """
+    session.execute(delete(Mention))
+    mention_table = sqlite_insert(Mention.__table__).prefix_with("OR IGNORE")
+
+    posts = session.execute(
+        select(RedditPost.id, RedditPost.subreddit, RedditPost.created_utc, RedditPost.title, RedditPost.selftext,
+               RedditPost.ticker_symbol, RedditPost.region, RedditPost.sentiment_score, RedditPost.upvotes)
+        .where(RedditPost.ticker_symbol != None)
+        .execution_options(yield_per=_REBUILD_BATCH_SIZE)
+    )
+    for batch in posts.partitions():
+        rows = []
+        for post in batch:
+            tickers = extract_tickers(f"{post.title} {post.selftext}") or [(post.ticker_symbol, post.region)]
+            rows.extend(
+                {"source_id": post.id, "source_type": "post", "ticker": ticker, "region": region,
+                 "subreddit": post.subreddit, "created_utc": post.created_utc,
+                 "sentiment": post.sentiment_score, "upvotes": post.upvotes}
+                for ticker, region in tickers
+            )
+        session.execute(mention_table, rows)
+
+    comments = session.execute(
+        select(RedditComment.id, RedditComment.body, RedditComment.ticker_symbol, RedditComment.region,
+               RedditComment.sentiment_score, RedditComment.upvotes, RedditPost.subreddit,
+               func.coalesce(RedditComment.created_utc, RedditPost.created_utc).label("created_utc"))
+        .join(RedditPost, RedditComment.post_id == RedditPost.id, isouter=True)
+        .where(RedditComment.ticker_symbol != None)
+        .execution_options(yield_per=_REBUILD_BATCH_SIZE)
+    )
+    for batch in comments.partitions():
+        rows = []
+        for comment in batch:
+            # Tickers in the body, else the ticker the comment inherited from its post.
+            tickers = extract_tickers(comment.body or "") or [(comment.ticker_symbol, comment.region)]
+            rows.extend(
+                {"source_id": comment.id, "source_type": "comment", "ticker": ticker, "region": region,
+                 "subreddit": comment.subreddit, "created_utc": comment.created_utc,
+                 "sentiment": comment.sentiment_score, "upvotes": comment.upvotes}
+                for ticker, region in tickers
+            )
+        session.execute(mention_table, rows)
+
+    # Readers holding a copy of the table (analytics.MentionAnalytics) must reload it in full.
+    bump_data_generation(session, MENTIONS_REBUILD_NAME)
+    bump_data_generation(session)
+
+def rebuild_sentiment_rollup(session):
+    """Recomputes the whole rollup from the mentions table."""
+    # Matches how SQLAlchemy stores DateTime values in SQLite, so keys line up with incremental upserts.
+    bucket = func.coalesce(
+        func.strftime("%Y-%m-%d %H:00:00.000000", Mention.created_utc),
+        text("'1970-01-01 00:00:00.000000'"),
+    )
+    source = (
+        select(
+            Mention.ticker,
+            Mention.region,
+            func.coalesce(Mention.subreddit, ""),
+            bucket,
+            func.count(),
+            func.coalesce(func.sum(Mention.sentiment), 0.0),
+            func.count(Mention.sentiment),
+        )
+        .group_by(Mention.ticker, Mention.region, func.coalesce(Mention.subreddit, ""), bucket)
+    )
+    session.execute(delete(SentimentRollup))
+    session.execute(insert(SentimentRollup).from_select(
+        ["ticker", "region", "subreddit", "bucket_start", "mention_count", "sentiment_sum", "sentiment_count"],
+        source,
+    ))
+
+def backfill_derived_tables(session):
+    """Builds mentions and the rollup once for databases with data from before they existed."""
+    if session.execute(select(Mention.ticker).limit(1)).first() is None:
+        if session.execute(select(RedditPost.id).where(RedditPost.ticker_symbol != None).limit(1)).first() or \
+                session.execute(select(RedditComment.id).where(RedditComment.ticker_symbol != None).limit(1)).first():
+            print("Building mentions and sentiment rollup from existing posts and comments...")
+            rebuild_mentions(session)
+            rebuild_sentiment_rollup(session)
+            session.commit()
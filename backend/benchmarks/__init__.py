@@ -0,0 +1,6 @@
+"""
+benchmarks
+----------
+Offline benchmark suite for the ingestion and reporting hot paths.
+Run with 'python -m benchmarks.run' from the backend directory.
+"""
@@ -0,0 +1,133 @@
+"""
+corpus.py
+---------
+Deterministic synthetic Reddit corpus in the same shape the fetcher produces
+(post dicts with nested comment trees), for benchmarks and load tests.
+The same seed and parameters always produce the same corpus.
+"""
+from datetime import datetime, timedelta
+import random
+
+from app.analysis.tickers import TICKER_MAP
+
+SUBREDDITS = (
+    ("stocks", "US"),
+    ("wallstreetbets", "US"),
+    ("TollbugataBets", "NO"),
+    ("norge", "NO"),
+)
+
+WORDS = (
+    "the a to and is it this that of for on with my just market stock shares price calls puts "
+    "buy sell hold long short today week earnings report guidance dip rally squeeze fed rates "
+    "think going up down bought sold chart support resistance volume options expiry"
+).split()
+
+SENTIMENT_WORDS = (
+    "great amazing love moon bullish strong win gains happy excellent solid "
+    "terrible awful hate crash bearish weak loss bagholder scared worst dump"
+).split()
+
+COPYPASTA = (
+    "I am not a financial advisor and this is not financial advice, but I just YOLOd my entire savings "
+    "into this and I have never been more confident about anything in my life. Diamond hands forever.",
+    "Sir, this is a Wendy's.",
+    "Positions or ban. Post your positions or this will be removed by the moderators.",
+    "Remember: the market can stay irrational longer than you can stay solvent. Trade responsibly.",
+    "This post has been removed. Please read the rules before posting again.",
+)
+
+START_TIME = datetime(2024, 1, 1)
+
+def _ticker_aliases() -> list[str]:
+    return [alias for info in TICKER_MAP.values() for alias in info["aliases"]]
+
+class CorpusGenerator:
+    """
+    Generates posts until the requested number of comments is reached.
+    mention_rate is the share of texts that name a ticker; copypasta_rate the share of
+    comments that repeat one of a few canned texts (which exercises the sentiment cache).
+    """
+
+    def __init__(self, seed: int = 0, comments_per_post: int = 20, mention_rate: float = 0.35,
+                 copypasta_rate: float = 0.05, max_depth: int = 5):
+        self.seed = seed
+        self.comments_per_post = comments_per_post
+        self.mention_rate = mention_rate
+        self.copypasta_rate = copypasta_rate
+        self.max_depth = max_depth
+        self.aliases = _ticker_aliases()
+
+    def _sentence(self, rng: random.Random, length: int) -> str:
+        words = [rng.choice(WORDS) for _ in range(length)]
+        words[rng.randrange(length)] = rng.choice(SENTIMENT_WORDS)
+        if rng.random() < self.mention_rate:
+            for _ in range(1 if rng.random() < 0.8 else 2):
+                alias = rng.choice(self.aliases)
+                alias = f"${alias}" if rng.random() < 0.1 else alias
+                words.insert(rng.randrange(len(words) + 1), alias)
+        return " ".join(words)
+
+    def _comments(self, rng: random.Random, post_index: int, count: int, created: datetime) -> list[dict]:
+        comments = []
+        depths = {}
+        for j in range(count):
+            comment_id = f"c{post_index}x{j}"
+            parent_id = None
+            # Replies attach to a random earlier comment that is not already at max depth.
+            if comments and rng.random() < 0.6:
+                parent = comments[rng.randrange(len(comments))]
+                if depths[parent["id"]] + 1 < self.max_depth:
+                    parent_id = parent["id"]
+            depths[comment_id] = depths[parent_id] + 1 if parent_id else 0
+            if rng.random() < self.copypasta_rate:
+                body = rng.choice(COPYPASTA)
+            else:
+                body = self._sentence(rng, rng.randint(6, 30))
+            comments.append({
+                "id": comment_id,
+                "author": f"user{rng.randrange(5000)}",
+                "body": body,
+                "upvotes": rng.randint(-5, 500),
+                "created_utc": (created + timedelta(minutes=rng.randint(1, 600))).isoformat(),
+                "parent_id": parent_id,
+            })
+        return comments
+
+    def iter_posts(self, n_comments: int):
+        """Yields post dicts until n_comments comments have been produced."""
+        rng = random.Random(self.seed)
+        produced = 0
+        post_index = 0
+        while produced < n_comments:
+            count = min(max(1, int(rng.expovariate(1 / self.comments_per_post))), n_comments - produced)
+            subreddit, region = SUBREDDITS[rng.randrange(len(SUBREDDITS))]
+            created = START_TIME + timedelta(minutes=post_index * 7 + rng.randint(0, 6))
+            yield {
+                "id": f"p{post_index}",
+                "subreddit": subreddit,
+                "region": region,
+                "title": self._sentence(rng, rng.randint(5, 15)),
+                "author": f"user{rng.randrange(5000)}",
+                "url": f"https://www.reddit.com/r/{subreddit}/comments/p{post_index}/",
+                "created_utc": created.isoformat(),
+                "upvotes": rng.randint(0, 5000),
+                "num_comments": count,
+                "selftext": self._sentence(rng, rng.randint(1, 60)) if rng.random() < 0.5 else "",
+                "comments": self._comments(rng, post_index, count, created),
+            }
+            produced += count
+            post_index += 1
+
+def generate_corpus(n_comments: int, seed: int = 0, **options) -> list[dict]:
+    """Returns the corpus as a list; see CorpusGenerator for the options."""
+    return list(CorpusGenerator(seed=seed, **options).iter_posts(n_comments))
+
+def refreshed_copy(posts: list[dict], seed: int = 1) -> list[dict]:
+    """Returns the same posts with changed upvotes and comment counts, as a later fetch would see them."""
+    rng = random.Random(seed)
+    refreshed = []
+    for post in posts:
+        comments = [{**comment, "upvotes": comment["upvotes"] + rng.randint(0, 20)} for comment in post["comments"]]
+        refreshed.append({**post, "upvotes": post["upvotes"] + rng.randint(0, 200), "comments": comments})
+    return refreshed
@@ -0,0 +1,174 @@
+"""
+run.py
+------
+Runs the benchmark suite and writes the results as JSON, so runs on different commits
+can be compared.
+
+    python -m benchmarks.run                          # 10k, 100k and 1M comments
+    python -m benchmarks.run --scales 10000 --output results.json
+
+Every scale runs in its own process against a fresh temporary SQLite database
+(selected through DATABASE_URL), with praw and finnhub stubbed out.
+"""
+from contextlib import redirect_stdout
+from datetime import datetime
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+
+# Texts used for the per-call benchmarks, so their cost does not grow with the scale.
+EXTRACT_SAMPLE = 50_000
+SENTIMENT_SAMPLE = 5_000
+
+FILTERED_SUBREDDITS = ["wallstreetbets", "norge"]
+
+def _timed(function, repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return times
+
+def _result(name: str, scale: int, times: list[float], items: int, unit: str) -> dict:
+    best = min(times)
+    return {
+        "name": name,
+        "scale": scale,
+        "repeats": len(times),
+        "min_s": best,
+        "median_s": statistics.median(times),
+        "items": items,
+        "unit": unit,
+        "items_per_s": items / best if best else None,
+    }
+
+def run_scale(scale: int, seed: int, repeat: int, workers: int) -> list[dict]:
+    """Runs every benchmark for one corpus size. Expects DATABASE_URL to point at an empty database."""
+    from .stubs import install_offline_stubs
+    install_offline_stubs()
+
+    from app.analysis.sentiment import analyze_sentiment, get_analyzer
+    from app.analysis.tickers import extract_tickers
+    from app.analysis.analytics import MentionAnalytics
+    from app.api import build_sentiment_report, mention_analytics
+    from app.database import SessionLocal, init_db
+    from app.services.data_generation import get_data_generation
+    from app.services.db_writer import insert_posts
+    from .corpus import generate_corpus, refreshed_copy
+
+    init_db()
+    posts = generate_corpus(scale, seed=seed)
+    comment_count = sum(len(post["comments"]) for post in posts)
+    texts = [f"{post['title']} {post['selftext']}" for post in posts]
+    texts += [comment["body"] for post in posts for comment in post["comments"]]
+    results = []
+
+    extract_texts = texts[:EXTRACT_SAMPLE]
+    times = _timed(lambda: [extract_tickers(text) for text in extract_texts], repeat)
+    results.append(_result("extract_tickers", scale, times, len(extract_texts), "texts"))
+
+    get_analyzer() # Load the lexicon outside the timing
+    sentiment_texts = texts[:SENTIMENT_SAMPLE]
+    times = _timed(lambda: [analyze_sentiment(text) for text in sentiment_texts], repeat)
+    results.append(_result("analyze_sentiment", scale, times, len(sentiment_texts), "texts"))
+
+    # Ingest changes the database, so each variant runs once.
+    with redirect_stdout(io.StringIO()):
+        times = _timed(lambda: insert_posts(posts, workers=workers), 1)
+    results.append(_result("insert_posts_new", scale, times, comment_count, "comments"))
+
+    refreshed = refreshed_copy(posts, seed=seed + 1)
+    with redirect_stdout(io.StringIO()):
+        times = _timed(lambda: insert_posts(refreshed, workers=workers), 1)
+    results.append(_result("insert_posts_existing", scale, times, comment_count, "comments"))
+
+    db = SessionLocal()
+    try:
+        generation = get_data_generation(db)
+        # Loading the columnar copy is what the first report request after an ingest pays.
+        times = _timed(lambda: MentionAnalytics().sync(db, generation), repeat)
+        mention_analytics.sync(db, generation)
+        results.append(_result("report_load_columns", scale, times, len(mention_analytics), "mentions"))
+
+        times = _timed(lambda: build_sentiment_report(db, [], "mentions", "desc"), repeat)
+        results.append(_result("get_sentiment_report", scale, times, len(mention_analytics), "mentions"))
+
+        times = _timed(lambda: build_sentiment_report(db, FILTERED_SUBREDDITS, "sentiment", "desc"), repeat)
+        results.append(_result("get_sentiment_report_filtered", scale, times, len(mention_analytics), "mentions"))
+    finally:
+        db.close()
+    return results
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _run_child(scale: int, args) -> list[dict]:
+    """Runs one scale in a subprocess with its own temporary database."""
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        output = os.path.join(directory, "results.json")
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}"}
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--child-scale", str(scale), "--child-output", output,
+            "--seed", str(args.seed), "--repeat", str(args.repeat), "--workers", str(args.workers),
+        ]
+        subprocess.run(command, env=env, check=True)
+        with open(output) as f:
+            return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ingestion and report benchmarks.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="Corpus sizes in comments")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus generator seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats for benchmarks that do not change the database")
+    parser.add_argument("--workers", type=int, default=1, help="Analysis processes for insert_posts")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--child-scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_scale is not None:
+        results = run_scale(args.child_scale, args.seed, args.repeat, args.workers)
+        with open(args.child_output, "w") as f:
+            json.dump(results, f)
+        return
+
+    results = []
+    for scale in args.scales:
+        print(f"Running benchmarks at {scale} comments...")
+        scale_results = _run_child(scale, args)
+        for result in scale_results:
+            print(f"  {result['name']:<30} {result['min_s']:>9.4f}s  {result['items_per_s'] or 0:>12.0f} {result['unit']}/s")
+        results.extend(scale_results)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+stubs.py
+--------
+Stand-ins for the praw and finnhub packages, so benchmarks run offline and fail loudly
+if anything tries to reach Reddit or Finnhub.
+"""
+import sys
+import types
+
+class _OfflineClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        raise RuntimeError(f"Network access ({name}) is disabled in benchmarks.")
+
+def install_offline_stubs():
+    """Registers the stub modules; must run before app code creates any client."""
+    for module_name, client_name in (("praw", "Reddit"), ("finnhub", "Client")):
+        module = types.ModuleType(module_name)
+        setattr(module, client_name, _OfflineClient)
+        sys.modules[module_name] = module
@@ -0,0 +1,62 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.reddit_fetcher import iter_posts_concurrent
+
+CONFIG = {"US": [{"name": "stocks", "type": "firehose"}, {"name": "broken", "type": "firehose"}]}
+
+class CommentForest(list):
+    def replace_more(self, limit=0):
+        pass
+
+def make_post(post_id: str, created: datetime):
+    return SimpleNamespace(id=post_id, title="GME", author="u", url=f"http://x/{post_id}", score=1,
+                           num_comments=0, selftext="", created_utc=(created - datetime(1970, 1, 1)).total_seconds())
+
+class StubReddit:
+    """Serves three posts per subreddit; r/broken fails after its first post, and so does
+    the comment tree of any post whose id is in failing_posts."""
+
+    def __init__(self, failing_posts=()):
+        self.failing_posts = set(failing_posts)
+
+    def subreddit(self, name):
+        def new(limit=None):
+            for i in range(3):
+                if name == "broken" and i == 1:
+                    raise RuntimeError("listing failed")
+                yield make_post(f"{name}{i}", datetime(2024, 1, 1, 12 - i))
+        return SimpleNamespace(new=new)
+
+    def submission(self, id):
+        if id in self.failing_posts:
+            raise RuntimeError("comments failed")
+        return SimpleNamespace(comments=CommentForest())
+
+def fetch(failures=None, failing_posts=(), config=CONFIG):
+    watermarks = {}
+    posts = iter_posts_concurrent(config, reddit_factory=lambda: StubReddit(failing_posts),
+                                  watermarks=watermarks, failures=failures)
+    return sorted(post["id"] for post in posts), watermarks
+
+def test_first_error_aborts_without_failures_dict():
+    with pytest.raises(RuntimeError, match="listing failed"):
+        fetch()
+
+def test_failed_listing_does_not_stop_other_subreddits():
+    failures = {}
+    ids, watermarks = fetch(failures)
+    assert ids == ["broken0", "stocks0", "stocks1", "stocks2"]
+    assert list(failures) == [("broken", "firehose")]
+    # Only the subreddit that completed advances its watermark.
+    assert watermarks == {("stocks", "firehose"): {"created_utc": datetime(2024, 1, 1, 12), "post_id": "stocks0"}}
+
+def test_failed_comment_tree_fails_its_subreddit():
+    failures = {}
+    config = {"US": [{"name": "stocks", "type": "firehose"}, {"name": "wallstreetbets", "type": "firehose"}]}
+    ids, watermarks = fetch(failures, failing_posts={"wallstreetbets1"}, config=config)
+    assert ids == ["stocks0", "stocks1", "stocks2", "wallstreetbets0", "wallstreetbets2"]
+    assert list(failures) == [("wallstreetbets", "firehose")]
+    assert list(watermarks) == [("stocks", "firehose")]
@@ -0,0 +1,106 @@
+from app.scheduler import Job, Scheduler, backoff_delay
+
+BACKOFF = {"base_seconds": 30, "max_seconds": 240, "jitter": 0}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def subreddit(name: str, priority: int, interval: float = 600) -> Job:
+    options = {"name": name, "region": "US", "type": "firehose", "limit": 20}
+    return Job(f"r/{name} (firehose)", "subreddit", interval, priority, options)
+
+def make_scheduler(jobs, fail=(), crash=False):
+    """
+    Scheduler whose runners log each run and take 10 clock seconds. Subreddit runs report the
+    jobs named in fail as failed (like fetch_subreddits), or raise with crash; periodic runs raise.
+    """
+    clock = FakeClock()
+    runs = []
+
+    def run_subreddits(jobs):
+        runs.append([job.name for job in jobs])
+        clock.now += 10
+        if crash:
+            raise RuntimeError("Reddit is down")
+        return [job for job in jobs if job.name in fail]
+
+    def run_periodic(jobs):
+        runs.append([job.name for job in jobs])
+        clock.now += 10
+        if jobs[0].name in fail:
+            raise RuntimeError(f"{jobs[0].name} failed")
+
+    runners = {"subreddit": run_subreddits, "finnhub_update": run_periodic, "reddit_refresh": run_periodic}
+    return Scheduler(jobs, runners, BACKOFF, clock=clock), clock, runs
+
+def test_due_jobs_run_by_priority():
+    wsb, stocks, norge = subreddit("wallstreetbets", 1), subreddit("stocks", 2), subreddit("norge", 7)
+    finnhub = Job("finnhub_update", "finnhub_update", 900, 3, {})
+    refresh = Job("reddit_refresh", "reddit_refresh", 3600, 8, {})
+    scheduler, clock, runs = make_scheduler([norge, refresh, finnhub, stocks, wsb])
+
+    assert scheduler.run_pending() == 4
+    assert runs == [
+        ["r/wallstreetbets (firehose)", "r/stocks (firehose)"],
+        ["finnhub_update"],
+        ["r/norge (firehose)"],
+        ["reddit_refresh"],
+    ]
+    # The next run is scheduled from when the run finished.
+    assert wsb.next_run == 10 + wsb.interval
+    assert finnhub.next_run == 20 + finnhub.interval
+
+def test_nothing_runs_before_it_is_due():
+    wsb = subreddit("wallstreetbets", 1)
+    scheduler, clock, runs = make_scheduler([wsb])
+    scheduler.run_pending()
+    clock.now = wsb.next_run - 1
+    assert scheduler.run_pending() == 0
+    clock.now = wsb.next_run
+    assert scheduler.run_pending() == 1
+    assert len(runs) == 2
+
+def test_failing_subreddit_backs_off_alone():
+    wsb, stocks = subreddit("wallstreetbets", 1), subreddit("stocks", 2)
+    scheduler, clock, runs = make_scheduler([wsb, stocks], fail={"r/stocks (firehose)"})
+
+    assert scheduler.run_pending() == 1
+    # Nothing is re-fetched; only the failing subreddit backs off.
+    assert runs == [["r/wallstreetbets (firehose)", "r/stocks (firehose)"]]
+    assert (wsb.failures, wsb.next_run) == (0, 10 + wsb.interval)
+    assert (stocks.failures, stocks.next_run) == (1, 10 + BACKOFF["base_seconds"])
+
+def test_crashed_batch_backs_off_every_job():
+    wsb, stocks = subreddit("wallstreetbets", 1), subreddit("stocks", 2)
+    scheduler, clock, runs = make_scheduler([wsb, stocks], crash=True)
+
+    assert scheduler.run_pending() == 1
+    assert [job.failures for job in (wsb, stocks)] == [1, 1]
+    assert wsb.next_run == stocks.next_run == 10 + BACKOFF["base_seconds"]
+
+def test_backoff_grows_and_resets_after_success():
+    finnhub = Job("finnhub_update", "finnhub_update", 900, 3, {})
+    fail = {"finnhub_update"}
+    scheduler, clock, runs = make_scheduler([finnhub], fail=fail)
+
+    delays = []
+    for _ in range(5):
+        scheduler.run_pending()
+        delays.append(finnhub.next_run - clock.now)
+        clock.now = finnhub.next_run
+    assert delays == [30, 60, 120, 240, 240] # Capped at max_seconds
+    assert finnhub.failures == 5
+
+    fail.clear()
+    scheduler.run_pending()
+    assert finnhub.failures == 0
+    assert finnhub.next_run == clock.now + finnhub.interval
+
+def test_backoff_jitter_stays_in_range():
+    for _ in range(100):
+        delay = backoff_delay(3, base_seconds=30, max_seconds=1800, jitter=0.5)
+        assert 60 <= delay <= 120
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { MultiSelectFilter } from './MultiSelectFilter';
 
@@ -12,6 +12,17 @@ const Flag = ({ region }) => {
 // The URL where our FastAPI backend is running.
 const API_BASE_URL = 'http://localhost:8000/api';
 
+const rowKey = (row) => `${row.ticker}:${row.region}`;
+
+// Sorts rows the way /api/report does: other sort keys fall back to sentiment,
+// and missing values sort lowest.
+const sortRows = (rows, sortBy, order) => {
+  const field = sortBy === 'mentions' || sortBy === 'weighted_sentiment' ? sortBy : 'avg_sentiment';
+  const value = (row) => (row[field] == null ? -Infinity : row[field]);
+  const direction = order === 'desc' ? -1 : 1;
+  return [...rows].sort((a, b) => (value(a) - value(b)) * direction || 0);
+};
+
 function Report() {
   const [reportData, setReportData] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -23,6 +34,9 @@ function Report() {
   const [selectedSubreddits, setSelectedSubreddits] = useState([]);
   const [sortBy, setSortBy] = useState('mentions');
   const [order, setOrder] = useState('desc');
+  // The stream handlers read the current sort from here, so sorting does not reopen the stream.
+  const sortRef = useRef({ sortBy, order });
+  sortRef.current = { sortBy, order };
 
   useEffect(() => {
     // Fetch the list of available subreddits for the filter dropdown
@@ -73,6 +87,43 @@ function Report() {
     fetchReportData();
   }, [selectedSubreddits, sortBy, order]); // Re-run this effect when any of these values change
 
+  useEffect(() => {
+    // Subscribe to live updates: after each ingest the server pushes only the rows that changed.
+    const params = new URLSearchParams();
+    selectedSubreddits.forEach(sub => params.append('subreddit', sub));
+    const source = new EventSource(`${API_BASE_URL}/stream/report?${params.toString()}`);
+
+    // The first event holds the full report, which replaces anything fetched before subscribing.
+    source.addEventListener('snapshot', (event) => {
+      const rows = JSON.parse(event.data);
+      const { sortBy, order } = sortRef.current;
+      setReportData(sortRows(rows, sortBy, order));
+    });
+
+    source.addEventListener('delta', (event) => {
+      const { changed, removed } = JSON.parse(event.data);
+      const removedKeys = new Set(removed.map(rowKey));
+
+      // The updater must not mutate anything outside it: StrictMode calls it twice.
+      setReportData(rows => {
+        const changedByKey = new Map(changed.map(row => [rowKey(row), row]));
+        const existingKeys = new Set(rows.map(rowKey));
+        const updated = rows
+          .filter(row => !removedKeys.has(rowKey(row)))
+          .map(row => {
+            const newRow = changedByKey.get(rowKey(row));
+            return newRow ? { ...row, ...newRow } : row;
+          });
+        // Tickers that were not in the report yet are added, then the rows are re-sorted.
+        const added = changed.filter(row => !existingKeys.has(rowKey(row)));
+        const { sortBy, order } = sortRef.current;
+        return sortRows([...updated, ...added], sortBy, order);
+      });
+    });
+
+    return () => source.close();
+  }, [selectedSubreddits]);
+
   const handleRowClick = (ticker) => {
     navigate(`/ticker/${ticker}`);
   };